@@ -0,0 +1,143 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+"""Synthetic maven projects and build logs, deterministic for a given size."""
+
+import os
+from typing import List
+
+POM = """<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <modelVersion>4.0.0</modelVersion>
+  <groupId>com.bench</groupId>
+  <artifactId>bench</artifactId>
+  <version>1.0</version>
+</project>
+"""
+
+
+def make_focal_class(package_name: str, class_name: str, num_methods: int, num_fields: int) -> str:
+    lines = [
+        f"package {package_name};",
+        "",
+        "import java.util.ArrayList;",
+        "import java.util.List;",
+        "",
+        "/**",
+        f" * Synthetic focal class {class_name}.",
+        " */",
+        f"public class {class_name} {{",
+    ]
+    for i in range(num_fields):
+        lines.append(f"    private int field{i} = {i};")
+    lines.append("    private final List<String> names = new ArrayList<>();")
+    lines.append("")
+    lines.append(f"    public {class_name}() {{")
+    lines.append("    }")
+    for i in range(num_methods):
+        lines.extend([
+            "",
+            "    /**",
+            f"     * Method {i} of {class_name}.",
+            "     */",
+            f"    public int method{i}(int a, String b) {{",
+            f"        int total = a + field{i % max(num_fields, 1)};",
+            "        for (int j = 0; j < b.length(); j++) {",
+            "            if (b.charAt(j) == 'x') {",
+            "                total += j;",
+            "            } else {",
+            "                names.add(b.substring(j));",
+            "            }",
+            "        }",
+            "        return total;",
+            "    }",
+        ])
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def make_test_class(package_name: str, class_name: str, num_methods: int) -> str:
+    lines = [
+        f"package {package_name};",
+        "",
+        "import static org.junit.Assert.assertEquals;",
+        "import org.junit.Test;",
+        "",
+        f"public class {class_name}Test {{",
+    ]
+    for i in range(num_methods):
+        lines.extend([
+            "",
+            "    @Test",
+            f"    public void testMethod{i}() {{",
+            f"        {class_name} focal = new {class_name}();",
+            f"        assertEquals({i}, focal.method{i}(0, \"\"));",
+            "    }",
+        ])
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def make_project(root: str, num_classes: int = 50, num_methods: int = 20, num_fields: int = 5, num_packages: int = 5) -> List[str]:
+    """
+    Write a maven project with `num_classes` focal classes and one test class each.
+    returns: paths of the test classes
+    """
+    with open(os.path.join(root, "pom.xml"), "w", encoding="utf-8") as f:
+        f.write(POM)
+
+    test_paths = []
+    for i in range(num_classes):
+        package_name = f"com.bench.pkg{i % num_packages}"
+        class_name = f"Focal{i}"
+        package_dir = package_name.replace(".", "/")
+        for source_root, text, file_name in (
+                ("src/main/java", make_focal_class(package_name, class_name, num_methods, num_fields), f"{class_name}.java"),
+                ("src/test/java", make_test_class(package_name, class_name, num_methods), f"{class_name}Test.java")):
+            dir_path = os.path.join(root, source_root, package_dir)
+            os.makedirs(dir_path, exist_ok=True)
+            with open(os.path.join(dir_path, file_name), "w", encoding="utf-8") as f:
+                f.write(text)
+        test_paths.append(os.path.join(root, "src/test/java", package_dir, f"{class_name}Test.java"))
+    return test_paths
+
+def make_maven_log(num_modules: int = 200, num_errors: int = 20) -> str:
+    """A multi-module `mvn clean verify` log ending with compiler errors in the last module."""
+    lines = ["[INFO] Scanning for projects..."]
+    for i in range(num_modules):
+        lines.extend([
+            "[INFO] ",
+            f"[INFO] ------------------------< com.bench:module{i} >------------------------",
+            f"[INFO] Building module{i} 1.0",
+            "[INFO] --------------------------------[ jar ]---------------------------------",
+            f"[INFO] --- maven-compiler-plugin:3.8.1:compile (default-compile) @ module{i} ---",
+            "[INFO] Changes detected - recompiling the module!",
+            f"[INFO] Compiling 42 source files to /bench/module{i}/target/classes",
+            "[WARNING] /bench/Deprecated.java: Some input files use or override a deprecated API.",
+            "[WARNING] /bench/Deprecated.java: Recompile with -Xlint:deprecation for details.",
+            f"[INFO] --- maven-surefire-plugin:2.22.2:test (default-test) @ module{i} ---",
+            "[INFO] ",
+            "[INFO] -------------------------------------------------------",
+            "[INFO]  T E S T S",
+            "[INFO] -------------------------------------------------------",
+            f"[INFO] Running com.bench.module{i}.FocalTest",
+            "[INFO] Tests run: 20, Failures: 0, Errors: 0, Skipped: 0, Time elapsed: 0.05 s",
+        ])
+    lines.extend([
+        "[INFO] -------------------------------------------------------------",
+        "[ERROR] COMPILATION ERROR : ",
+        "[INFO] -------------------------------------------------------------",
+    ])
+    for i in range(num_errors):
+        lines.extend([
+            f"[ERROR] /bench/src/test/java/com/bench/FocalTestGeneration.java:[{10 + i},9] cannot find symbol",
+            "  symbol:   method missing()",
+            "  location: class com.bench.Focal",
+        ])
+    lines.extend([
+        f"[INFO] {num_errors} errors ",
+        "[INFO] -------------------------------------------------------------",
+        "[INFO] ------------------------------------------------------------------------",
+        "[INFO] BUILD FAILURE",
+        "[INFO] ------------------------------------------------------------------------",
+    ])
+    return "\n".join(lines) + "\n"
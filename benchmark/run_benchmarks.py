@@ -0,0 +1,221 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+"""
+Time and memory of the extraction, prompt construction, log parsing and
+repair loop stages on a synthetic corpus, written as JSON.
+usage: python benchmark/run_benchmarks.py --output results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import javalang
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+
+from benchmark.corpus import make_focal_class, make_maven_log, make_project
+from chattester.checker import UnitTestChecker
+from chattester.focal import ProjectUnitTestExtractor
+from chattester.javalang_utils import get_method_start_end
+from chattester.maven_parser import MavenOutput, MavenOutputLine, MavenOutputParser
+from chattester.source import ClassInfo, ParsedJavaFile
+from chattester.tester import ChatGPTUnitTestGenerator
+
+FAKE_ANSWER = """```java
+    @Test
+    public void testMethod0() {
+        assertEquals(0, new Focal0().method0(0, ""));
+    }
+```"""
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers every prompt instantly with the same test method."""
+    model_name: str = "fake"
+    temperature: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=FAKE_ANSWER))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+
+class StubChecker(UnitTestChecker):
+    """Fails the first `num_failures` checks of every pair with a compiler error, without building."""
+    def __init__(self, project_path: str, num_failures: int = 1) -> None:
+        super().__init__(project_path)
+        self.num_failures = num_failures
+        self.calls = 0
+
+    def create_test(self, path: str, content: str):
+        pass
+
+    def check(self, test_path: str, cancel_event=None) -> MavenOutput:
+        failed = self.calls % (self.num_failures + 1) < self.num_failures
+        self.calls += 1
+        out = MavenOutput([])
+        if failed:
+            out.status = "failure"
+            out.append(MavenOutputLine("error", "/bench/FocalTestGeneration.java:[8,9] cannot find symbol"))
+        else:
+            out.status = "success"
+        return out
+
+
+def measure(name: str, fn: Callable, repeat: int, setup: Optional[Callable[[], tuple]] = None, **params) -> Dict[str, Any]:
+    """
+    Time `repeat` calls of `fn`, then trace the allocations of one more call.
+    params:
+        setup: returns the arguments of `fn`, not timed
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+
+    args = setup() if setup is not None else ()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "min": min(times),
+        "mean": statistics.mean(times),
+        "median": statistics.median(times),
+        "max": max(times),
+        "peak_memory_bytes": peak_memory,
+    }
+
+@contextlib.contextmanager
+def working_directory(path: str):
+    old_path = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old_path)
+
+
+def run_benchmarks(args) -> List[Dict[str, Any]]:
+    results = []
+    selected = lambda name: args.filter is None or any(f in name for f in args.filter)
+
+    with tempfile.TemporaryDirectory() as project_path:
+        make_project(project_path, num_classes=args.classes, num_methods=args.methods)
+        extractor = ProjectUnitTestExtractor(project_path)
+
+        if selected("get_all_tests"):
+            results.append(measure(
+                "ProjectUnitTestExtractor.get_all_tests",
+                lambda: extractor.get_all_tests(num_workers=args.workers),
+                args.repeat, classes=args.classes, methods=args.methods, workers=args.workers,
+            ))
+
+        # one large focal class
+        big_class = make_focal_class("com.bench", "Big", args.big_methods, args.big_methods)
+        big_tree = javalang.parse.parse(big_class)
+        big_methods = [node for _, node in big_tree.filter(javalang.tree.MethodDeclaration)]
+        if selected("get_method_start_end"):
+            results.append(measure(
+                "get_method_start_end",
+                lambda: [get_method_start_end(big_tree, node) for node in big_methods],
+                args.repeat, methods=len(big_methods),
+            ))
+        if selected("ClassInfo.from_node"):
+            def setup_class_info():
+                parsed = ParsedJavaFile("Big.java", big_class)
+                node = next(node for _, node in parsed.tree.filter(javalang.tree.ClassDeclaration))
+                return parsed, node
+            results.append(measure(
+                "ClassInfo.from_node",
+                ClassInfo.from_node,
+                args.repeat, setup=setup_class_info, methods=len(big_methods),
+            ))
+
+        pairs = extractor.get_all_tests()
+        generator = ChatGPTUnitTestGenerator(project_path, model=FakeChatModel())
+        generator.checker = StubChecker(project_path, num_failures=args.repair_rounds)
+        if selected("_get_focal_part"):
+            results.append(measure(
+                "ChatGPTUnitTestGenerator._get_focal_part",
+                lambda: [generator._get_focal_part(pair) for pair in pairs],
+                args.repeat, pairs=len(pairs),
+            ))
+
+        if selected("MavenOutputParser.parse"):
+            log = make_maven_log(num_modules=args.log_modules)
+            parser = MavenOutputParser()
+            results.append(measure(
+                "MavenOutputParser.parse",
+                lambda: parser.parse(log),
+                args.repeat, log_bytes=len(log.encode("utf-8")),
+            ))
+
+        if selected("iterative_generate"):
+            loop_pairs = pairs[:args.loop_pairs]
+            with tempfile.TemporaryDirectory() as work_dir, working_directory(work_dir):
+                results.append(measure(
+                    "ChatGPTUnitTestGenerator.iterative_generate",
+                    lambda: [generator.iterative_generate(pair, max_n=args.repair_rounds + 1) for pair in loop_pairs],
+                    args.repeat, pairs=len(loop_pairs), repair_rounds=args.repair_rounds,
+                ))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatTester benchmarks")
+    parser.add_argument("--classes", type=int, default=50, help="focal classes in the synthetic project")
+    parser.add_argument("--methods", type=int, default=20, help="methods per focal class")
+    parser.add_argument("--big-methods", type=int, default=100, help="methods of the large class")
+    parser.add_argument("--log-modules", type=int, default=2000, help="modules in the synthetic maven log")
+    parser.add_argument("--loop-pairs", type=int, default=20, help="pairs run through iterative_generate")
+    parser.add_argument("--repair-rounds", type=int, default=1, help="failed checks per pair in iterative_generate")
+    parser.add_argument("--workers", type=int, default=1, help="workers of get_all_tests")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", nargs="*", default=None, help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--output", type=str, default=None, help="JSON file, stdout by default")
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "results": run_benchmarks(args),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from chattester.source import from_compact, to_compact
+
+EXTRACTION_SCHEMA_VERSION = 4
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskCache(object):
+    """
+    JSON values stored one file per key under `cache_dir`.
+    Reads refresh the file mtime, `evict` drops least recently used entries
+    until the cache fits in `max_entries` and `max_bytes`.
+    """
+    def __init__(self, cache_dir: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, content_hash(key) + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key: str, value: Any):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+            os.remove(path)
+
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total_bytes = sum(e[1] for e in entries)
+        while len(entries) > 0 and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and total_bytes > self.max_bytes)
+        ):
+            mtime, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
+class ExtractionCache(DiskCache):
+    """
+    Extraction results per source file, keyed by path.
+    An entry is only used while the file content hash, the result type and
+    `EXTRACTION_SCHEMA_VERSION` all match.
+    """
+    def load(self, path: str, codetext: str, model_type: Type[ModelT]) -> Optional[ModelT]:
+        entry = self.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        if entry.get("schema") != EXTRACTION_SCHEMA_VERSION \
+                or entry.get("kind") != model_type.__name__ \
+                or entry.get("hash") != content_hash(codetext):
+            return None
+        return from_compact(entry["data"], model_type)
+
+    def store(self, path: str, codetext: str, value: BaseModel):
+        self.put(os.path.abspath(path), {
+            "schema": EXTRACTION_SCHEMA_VERSION,
+            "kind": type(value).__name__,
+            "hash": content_hash(codetext),
+            "data": to_compact(value),
+        })
+
+    def invalidate(self, path: Optional[str] = None):
+        if path is None:
+            self.clear()
+        else:
+            self.delete(os.path.abspath(path))
+
+
+class CacheMissError(Exception):
+    pass
+
+
+class ResponseCache(DiskCache):
+    """
+    Model responses keyed by model name, temperature and the fully rendered
+    prompt including conversation history. Entries older than `ttl` seconds
+    are ignored. In `replay` mode a miss raises CacheMissError instead of
+    letting the caller query the model, and recordings never expire.
+    """
+    def __init__(self,
+            cache_dir: str,
+            ttl: Optional[float] = None,
+            max_entries: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            replay: bool = False,
+        ) -> None:
+        super().__init__(cache_dir, max_entries=max_entries, max_bytes=max_bytes)
+        self.ttl = ttl
+        self.replay = replay
+
+    @staticmethod
+    def make_key(model_name: str, temperature: Optional[float], prompt: str, num_candidates: int = 1) -> str:
+        if num_candidates == 1:
+            return json.dumps([model_name, temperature, prompt])
+        return json.dumps([model_name, temperature, prompt, num_candidates])
+
+    def lookup(self, key: str) -> Optional[str]:
+        entry = self.get(key)
+        if entry is not None and entry.get("key") == key:
+            if self.replay or self.ttl is None or time.time() - entry["created"] <= self.ttl:
+                return entry["response"]
+        if self.replay:
+            raise CacheMissError("No cached response in replay mode for prompt:\n" + key)
+        return None
+
+    def store(self, key: str, response: str):
+        self.put(key, {"key": key, "created": time.time(), "response": response})
@@ -4,26 +4,562 @@
 # file that should have been included as part of this package.
 
 
-from chattester.cmd_utils import system_call
+from chattester.cmd_utils import CommandResult, LineConsumer, run_command
+from chattester.compile_service import REQUEST_TIMEOUT, CompileResult, CompileService, CompileServiceError, TestFailure, TestRunResult
+from chattester.instrumentation import Instrumentation
+from chattester.maven_parser import JavacOutputParser, MavenOutput, MavenOutputLine, MavenOutputParser
+from chattester.surefire_parser import MAX_FRAMES, SurefireReportParser, TestCaseResult, TestReport, get_failure_line, parse_stack_trace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import contextlib
+import glob
 import shutil
 import os
+import re
+import threading
+
+CLASSPATH_FILE = "target/chattester-classpath.txt"
+# file name suffix of the generated test classes, next to the test they are generated for
+GENERATED_TEST_SUFFIX = "Generation.java"
+# generated tests are renamed with this suffix while the project is built for its classpath
+HIDDEN_SUFFIX = ".chattester-hidden"
+# exceptions reported as test failures rather than errors
+ASSERTION_TYPES = ("AssertionError", "ComparisonFailure", "AssertionFailedError")
+# `1) testName(com.example.FooTest)` headers of the JUnitCore failure list
+JUNIT_FAILURE_PATTERN = re.compile(r"^[0-9]+\) (.*)\(([\w$.]+)\)$")
+JUNIT_MISSING_CLASS_PATTERN = re.compile(r"^Could not find class: ([\w$.]+)")
+# builds the given tests, returns the output of every test it could resolve, or None if they did not compile, and the build output
+BatchBuild = Callable[[List[str]], Tuple[Optional[Dict[str, MavenOutput]], MavenOutput]]
+# keep building the other modules and count failing tests as results, not build failures
+MAVEN_BATCH_ARGS = ("-fae", "-Dmaven.test.failure.ignore=true")
+
+
+def parse_junit_failures(output: str) -> Dict[str, List[TestFailure]]:
+    """
+    Failures listed by a JUnitCore run of several test classes.
+    returns: failures per test class name
+    """
+    failures: Dict[str, List[TestFailure]] = {}
+    current = None
+    for line in output.splitlines():
+        header = JUNIT_FAILURE_PATTERN.match(line)
+        missing = JUNIT_MISSING_CLASS_PATTERN.match(line)
+        if header is not None:
+            current = TestFailure(name=f"{header.group(1)}({header.group(2)})")
+            failures.setdefault(header.group(2), []).append(current)
+        elif missing is not None:
+            current = None
+            failures.setdefault(missing.group(1), []).append(TestFailure(name=missing.group(1), message=line, trace=line))
+        elif current is None:
+            continue
+        elif line.startswith("FAILURES!!!") or (line.strip() == "" and current.trace != ""):
+            current = None
+        else:
+            if current.trace == "":
+                # `exception type: message`
+                current.message = line.split(":", 1)[1].strip() if ":" in line else None
+            current.trace += line + "\n"
+    return failures
 
 class UnitTestChecker(object):
-    def __init__(self, project_path: str) -> None:
-        self.project_path = project_path
-    
+    """
+    Validates generated tests.
+    mode `maven` runs `mvn clean verify` on the whole project, mode `focused`
+    compiles only the generated test class against the already built classes
+    and runs only that class, mode `service` does the same in a warm JVM per
+    module (see `CompileService`) instead of starting `javac` and `java`.
+    """
+    # builds for classpath resolution may share `target` directories, run one at a time
+    _build_lock = threading.Lock()
+
+    def __init__(self, project_path: str, mode: str = "maven", test_output_dir: Optional[str] = None, timeout: Optional[float] = None,
+            instrumentation: Optional[Instrumentation] = None) -> None:
+        """
+        params:
+            project_path: root of the maven project
+            mode: `maven`, `focused` or `service`
+            test_output_dir: directory name inside each module for compiled generated tests in focused and service mode,
+                `target/test-classes` by default
+            timeout: seconds before a build or test command is killed, unlimited if None
+                except for compile service requests, which default to `REQUEST_TIMEOUT`
+            instrumentation: receives a `check` span per check and a `command` span per command
+        """
+        # commands run inside the module, every path given to them must be absolute
+        self.project_path = os.path.abspath(project_path)
+        self.mode = mode
+        self.test_output_dir = test_output_dir
+        self.timeout = timeout
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        # commands run by the last `check`
+        self.last_results: List[CommandResult] = []
+        self.mvn_parser = MavenOutputParser()
+        self.javac_parser = JavacOutputParser()
+        self.report_parser = SurefireReportParser()
+        self._classpaths: Dict[str, str] = {}
+        self._services: Dict[str, CompileService] = {}
+
     def get_core_class_name(self, path: str) -> str:
         file_path = os.path.normpath(path).replace("\\", "/")
         core_class_name = file_path.split("/")[-1].replace(".java", "")
         return core_class_name
-    
+
+    def get_module_path(self, test_path: str) -> str:
+        file_path = os.path.abspath(test_path).replace("\\", "/")
+        if "/src/test/" not in file_path:
+            return self.project_path
+        return file_path[:file_path.rindex("/src/test/")]
+
+    def get_test_class_name(self, test_path: str) -> str:
+        file_path = os.path.normpath(test_path).replace("\\", "/")
+        if "/src/test/java/" in file_path:
+            file_path = file_path[file_path.rindex("/src/test/java/") + len("/src/test/java/"):]
+        return file_path.replace(".java", "").replace("/", ".")
+
+    def get_test_output_dir(self, module_path: str) -> str:
+        if self.test_output_dir is None:
+            return os.path.join(module_path, "target", "test-classes")
+        return os.path.join(module_path, self.test_output_dir)
+
     def create_test(self, path: str, content: str):
+        # never write through a hardlink shared with another copy of the project
+        if os.path.exists(path):
+            os.remove(path)
         with open(path, "w", encoding="utf-8") as f:
             f.write(content)
 
     def remove_test(self, path: str):
         os.remove(path)
 
-    def run_tests(self):
-        output, success = system_call(["mvn", "clean", "verify"], cwd=self.project_path)
-        return output, success
\ No newline at end of file
+    def _run(self, args: List[str], cwd: str, cancel_event: Optional[threading.Event] = None, on_line: Optional[LineConsumer] = None) -> CommandResult:
+        with self.instrumentation.span("command", project=self.project_path, command=os.path.basename(args[0])) as span:
+            result = run_command(args, cwd=cwd, timeout=self.timeout, on_line=on_line, cancel_event=cancel_event)
+            span.set(
+                returncode=result.returncode, timed_out=result.timed_out, cancelled=result.cancelled,
+                output_size=result.output_size,
+            )
+        self.last_results.append(result)
+        return result
+
+    def run_tests(self, cancel_event: Optional[threading.Event] = None, on_line: Optional[LineConsumer] = None,
+            extra_args: Sequence[str] = ()):
+        result = self._run(["mvn", "clean", "verify"] + list(extra_args), self.project_path, cancel_event, on_line)
+        return result.output, result.success
+
+    @contextlib.contextmanager
+    def _hide_generated_tests(self):
+        """Keep generated tests, which may not compile, out of the build of the project."""
+        pattern = os.path.join(self.project_path, "**", "src", "test", "**", "*" + GENERATED_TEST_SUFFIX)
+        paths = glob.glob(pattern, recursive=True)
+        hidden = []
+        try:
+            for path in paths:
+                os.replace(path, path + HIDDEN_SUFFIX)
+                hidden.append(path)
+            yield
+        finally:
+            for path in hidden:
+                os.replace(path + HIDDEN_SUFFIX, path)
+
+    def prepare(self):
+        """
+        Resolve the classpath of every module in focused and service mode,
+        before generated tests are written into the tree.
+        """
+        if self.mode == "maven":
+            return
+        for pom_path in glob.glob(os.path.join(self.project_path, "**", "pom.xml"), recursive=True):
+            module_path = os.path.dirname(pom_path)
+            if not os.path.isdir(os.path.join(module_path, "src", "test")):
+                continue
+            classpath, output = self.resolve_classpath(module_path)
+            if classpath is None:
+                print("Failed to resolve the classpath of " + module_path)
+
+    def resolve_classpath(self, module_path: str) -> Tuple[Optional[str], str]:
+        """
+        Build main and test classes of the project once and resolve the test
+        classpath of `module_path`, cached for the lifetime of the checker.
+        returns: classpath (None if the build failed), build output
+        """
+        if module_path in self._classpaths:
+            return self._classpaths[module_path], ""
+
+        classpath_file = os.path.join(module_path, CLASSPATH_FILE)
+        output = ""
+        with UnitTestChecker._build_lock:
+            built = os.path.exists(classpath_file) and os.path.isdir(os.path.join(module_path, "target", "classes"))
+            if not built:
+                with self._hide_generated_tests():
+                    output = self._run([
+                        "mvn", "-q", "test-compile", "dependency:build-classpath",
+                        "-Dmdep.outputFile=" + CLASSPATH_FILE,
+                    ], self.project_path).output
+                if not os.path.exists(classpath_file):
+                    return None, output
+
+        with open(classpath_file, "r", encoding="utf-8") as f:
+            dependencies = f.read().strip()
+        classpath = os.pathsep.join([
+            self.get_test_output_dir(module_path),
+            os.path.join(module_path, "target", "test-classes"),
+            os.path.join(module_path, "target", "classes"),
+            dependencies,
+        ])
+        self._classpaths[module_path] = classpath
+        return classpath, output
+
+    def run_focused_test(self, test_path: str, cancel_event: Optional[threading.Event] = None) -> MavenOutput:
+        test_path = os.path.abspath(test_path)
+        module_path = self.get_module_path(test_path)
+        classpath, output = self.resolve_classpath(module_path)
+        if classpath is None:
+            out = self.mvn_parser.parse(output)
+            out.status = "failure"
+            return out
+
+        os.makedirs(self.get_test_output_dir(module_path), exist_ok=True)
+        result = self._run([
+            "javac", "-nowarn", "-encoding", "UTF-8",
+            "-d", self.get_test_output_dir(module_path),
+            "-cp", classpath,
+            test_path,
+        ], module_path, cancel_event)
+        if not result.success:
+            with self.instrumentation.span("parse_output", project=self.project_path, parser="javac"):
+                return self._interrupted_output(result) or self.javac_parser.parse(result.output)
+
+        class_name = self.get_test_class_name(test_path)
+        result = self._run([
+            "java", "-cp", classpath,
+            "org.junit.runner.JUnitCore", class_name,
+        ], module_path, cancel_event)
+        out = self._interrupted_output(result)
+        if out is not None:
+            return out
+        with self.instrumentation.span("parse_output", project=self.project_path, parser="junit"):
+            failures = parse_junit_failures(result.output).get(class_name, [])
+            # a run that fails without listing a test failure, ex. a crashed JVM
+            error = result.output.strip() if not result.success and len(failures) == 0 else None
+            out = self._run_output(TestRunResult(success=result.success and len(failures) == 0, failures=failures, error=error), class_name)
+        out.text = result.output
+        return out
+
+    def get_compile_service(self, module_path: str, classpath: str) -> CompileService:
+        if module_path not in self._services:
+            timeout = self.timeout if self.timeout is not None else REQUEST_TIMEOUT
+            self._services[module_path] = CompileService(classpath, timeout=timeout, cwd=module_path)
+        return self._services[module_path]
+
+    def close(self):
+        """Stop the compile services started by this checker."""
+        for service in self._services.values():
+            service.stop()
+        self._services = {}
+
+    def _compile_output(self, result: CompileResult, test_path: str) -> MavenOutput:
+        out = MavenOutput([])
+        out.status = "success" if result.success else "failure"
+        for diagnostic in result.diagnostics:
+            level = "error" if diagnostic.kind == "error" else "warning"
+            if diagnostic.line is None:
+                out.append(MavenOutputLine(level, diagnostic.message))
+                continue
+            path = diagnostic.path or test_path
+            out.append(MavenOutputLine(level, f"{path}:[{diagnostic.line},{diagnostic.column or 1}] {diagnostic.message}"))
+        out.text = "\n".join(line.msg for line in out.output)
+        return out
+
+    def _run_output(self, result: TestRunResult, class_name: str) -> MavenOutput:
+        out = MavenOutput([])
+        out.status = "success" if result.success else "failure"
+        report = TestReport(name=class_name, tests=result.run_count, failures=len(result.failures))
+        for failure in result.failures:
+            frames = parse_stack_trace(failure.trace)
+            # the trace starts with `exception type: message`
+            exception_type = failure.trace.split("\n")[0].split(":")[0].strip() or None
+            is_assertion = exception_type is not None and exception_type.endswith(ASSERTION_TYPES)
+            report.test_cases.append(TestCaseResult(
+                # JUnit 4 test headers are `method(class)`
+                name=failure.name.split("(")[0],
+                class_name=class_name,
+                status="failure" if is_assertion else "error",
+                message=failure.message,
+                type=exception_type,
+                frames=frames[:MAX_FRAMES],
+                line=get_failure_line(frames, class_name),
+            ))
+            out.append(MavenOutputLine("error", failure.trace.strip()))
+        if result.error is not None:
+            out.status = "failure"
+            out.append(MavenOutputLine("error", result.error))
+        out.test_report = report
+        out.text = "\n".join(line.msg for line in out.output)
+        return out
+
+    def run_service_test(self, test_path: str, cancel_event: Optional[threading.Event] = None) -> MavenOutput:
+        """
+        params:
+            cancel_event: checked before each request to the compile service, a request is not interrupted
+        """
+        test_path = os.path.abspath(test_path)
+        module_path = self.get_module_path(test_path)
+        classpath, output = self.resolve_classpath(module_path)
+        if classpath is None:
+            out = self.mvn_parser.parse(output)
+            out.status = "failure"
+            return out
+
+        service = self.get_compile_service(module_path, classpath)
+        with open(test_path, "r", encoding="utf-8") as f:
+            source_text = f.read()
+        class_name = self.get_test_class_name(test_path)
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                return self._cancelled_output(f"compile {class_name}")
+            with self.instrumentation.span("compile_service", project=self.project_path, request="compile") as span:
+                compile_result = service.compile(test_path, source_text, self.get_test_output_dir(module_path))
+                span.set(success=compile_result.success, restarts=service.restarts)
+            if not compile_result.success:
+                return self._compile_output(compile_result, test_path)
+            if cancel_event is not None and cancel_event.is_set():
+                return self._cancelled_output(f"run {class_name}")
+            with self.instrumentation.span("compile_service", project=self.project_path, request="run") as span:
+                run_result = service.run_tests(class_name)
+                span.set(success=run_result.success, restarts=service.restarts)
+            return self._run_output(run_result, class_name)
+        except CompileServiceError as e:
+            out = MavenOutput([])
+            out.status = "failure"
+            out.append(MavenOutputLine("error", f"Failed to check {class_name} with the compile service: {e}"))
+            return out
+
+    def _get_batch_errors(self, out: MavenOutput, test_paths: List[str]) -> Dict[str, MavenOutput]:
+        """Compiler errors of `out` per test of the batch whose file they were reported in."""
+        keys = {os.path.abspath(path).replace("\\", "/"): path for path in test_paths}
+        errors: Dict[str, MavenOutput] = {}
+        for line in out.filter("error").output:
+            msg = line.msg.replace("\\", "/")
+            matches = [key for key in keys if key in msg]
+            if len(matches) == 0:
+                continue
+            path = keys[max(matches, key=len)]
+            if path not in errors:
+                errors[path] = MavenOutput([])
+                errors[path].status = "failure"
+                errors[path].text = out.text
+            errors[path].append(line)
+        return errors
+
+    def _check_isolated(self, test_paths: List[str], build: BatchBuild,
+            baseline: Optional[Callable[[], MavenOutput]] = None) -> Dict[str, MavenOutput]:
+        """
+        Build the tests together, a test that does not compile must not hide the
+        results of the others: tests the compiler errors are attributed to are
+        reported and the rest is built again, and a failure nobody is blamed for
+        is narrowed down by bisecting the batch.
+        params:
+            baseline: builds without the tests, run once before bisecting so that a build
+                broken for another reason fails the batch instead of every half of it
+        """
+        outputs: Dict[str, MavenOutput] = {}
+        batches = [list(test_paths)]
+        while len(batches) > 0:
+            batch = batches.pop()
+            results, out = build(batch)
+            if results is None:
+                errors = self._get_batch_errors(out, batch)
+                if len(errors) > 0:
+                    outputs.update(errors)
+                    rest = [path for path in batch if path not in errors]
+                    if len(rest) > 0:
+                        batches.append(rest)
+                    continue
+                results = {}
+            outputs.update(results)
+            # tests the build gave no result for
+            rest = [path for path in batch if path not in results]
+            if len(rest) == 0:
+                continue
+            elif len(results) > 0:
+                batches.append(rest)
+            elif len(batch) == 1:
+                outputs[batch[0]] = out
+            elif baseline is not None and baseline().status != "success":
+                for path in batch + [path for other in batches for path in other]:
+                    outputs[path] = out
+                batches = []
+            else:
+                baseline = None
+                middle = len(batch) // 2
+                batches.extend([batch[middle:], batch[:middle]])
+        return outputs
+
+    def _build_maven_batch(self, sources: Dict[str, str], batch: List[str],
+            cancel_event: Optional[threading.Event]) -> Tuple[Optional[Dict[str, MavenOutput]], MavenOutput]:
+        # only the tests of this batch are in the tree during the build
+        for path in sources:
+            if path in batch and not os.path.exists(path):
+                self.create_test(path, sources[path])
+            elif path not in batch and os.path.exists(path):
+                self.remove_test(path)
+
+        stream = self.mvn_parser.stream()
+        self.run_tests(cancel_event, on_line=stream.feed, extra_args=MAVEN_BATCH_ARGS)
+        result = self.last_results[-1]
+        interrupted = self._interrupted_output(result)
+        if interrupted is not None:
+            return {path: interrupted for path in batch}, interrupted
+        with self.instrumentation.span("parse_output", project=self.project_path, parser="maven", batch_size=len(batch)):
+            out = stream.finish()
+            if len(self._get_batch_errors(out, batch)) > 0:
+                return None, out
+
+            results = {}
+            for path in batch:
+                test_out = MavenOutput(list(out.output))
+                test_out.text = out.text
+                test_out.status = out.status
+                self._read_test_report(test_out, path)
+                # without its report, a test of a failed build did not run: no result to share
+                if test_out.test_report is not None or out.status == "success":
+                    results[path] = test_out
+        return results, out
+
+    def _build_focused_batch(self, module_path: str, classpath: str, batch: List[str],
+            cancel_event: Optional[threading.Event]) -> Tuple[Optional[Dict[str, MavenOutput]], MavenOutput]:
+        os.makedirs(self.get_test_output_dir(module_path), exist_ok=True)
+        result = self._run([
+            "javac", "-nowarn", "-encoding", "UTF-8",
+            "-d", self.get_test_output_dir(module_path),
+            "-cp", classpath,
+        ] + [os.path.abspath(path) for path in batch], module_path, cancel_event)
+        interrupted = self._interrupted_output(result)
+        if interrupted is not None:
+            return {path: interrupted for path in batch}, interrupted
+        if not result.success:
+            with self.instrumentation.span("parse_output", project=self.project_path, parser="javac", batch_size=len(batch)):
+                out = self.javac_parser.parse(result.output)
+            # errors without a position are not recognized by the parser
+            out.status = "failure"
+            return None, out
+
+        class_names = {path: self.get_test_class_name(path) for path in batch}
+        result = self._run([
+            "java", "-cp", classpath,
+            "org.junit.runner.JUnitCore",
+        ] + list(class_names.values()), module_path, cancel_event)
+        interrupted = self._interrupted_output(result)
+        if interrupted is not None:
+            return {path: interrupted for path in batch}, interrupted
+        with self.instrumentation.span("parse_output", project=self.project_path, parser="junit", batch_size=len(batch)):
+            failures = parse_junit_failures(result.output)
+            results = {}
+            for path, class_name in class_names.items():
+                class_failures = failures.get(class_name, [])
+                # JUnitCore only counts the tests of the whole run
+                test_out = self._run_output(TestRunResult(success=len(class_failures) == 0, failures=class_failures), class_name)
+                test_out.text = result.output
+                results[path] = test_out
+        out = MavenOutput([])
+        out.text = result.output
+        return results, out
+
+    def check_batch(self, test_paths: List[str], cancel_event: Optional[threading.Event] = None) -> Dict[str, MavenOutput]:
+        """
+        Validate generated tests of different pairs in one build, instead of a
+        build per test. The tests must be in the tree already and are left there.
+        In service mode the tests are checked one by one in the warm JVM.
+        returns: output of each test, by path
+        """
+        with self.instrumentation.span("check_batch", project=self.project_path, mode=self.mode, batch_size=len(test_paths)) as span:
+            outputs = self._check_batch(test_paths, cancel_event)
+            span.set(passed=sum(1 for out in outputs.values() if out.status == "success"))
+        return outputs
+
+    def _check_batch(self, test_paths: List[str], cancel_event: Optional[threading.Event] = None) -> Dict[str, MavenOutput]:
+        self.last_results = []
+        if len(test_paths) == 0:
+            return {}
+        if self.mode == "service":
+            return {path: self.run_service_test(path, cancel_event) for path in test_paths}
+        elif self.mode == "focused":
+            modules: Dict[str, List[str]] = {}
+            for path in test_paths:
+                modules.setdefault(self.get_module_path(path), []).append(path)
+            outputs = {}
+            for module_path, paths in modules.items():
+                classpath, output = self.resolve_classpath(module_path)
+                if classpath is None:
+                    out = self.mvn_parser.parse(output)
+                    out.status = "failure"
+                    outputs.update({path: out for path in paths})
+                    continue
+                outputs.update(self._check_isolated(
+                    paths, lambda batch: self._build_focused_batch(module_path, classpath, batch, cancel_event),
+                ))
+            return outputs
+        else:
+            sources = {}
+            for path in test_paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    sources[path] = f.read()
+            try:
+                return self._check_isolated(
+                    test_paths, lambda batch: self._build_maven_batch(sources, batch, cancel_event),
+                    baseline=lambda: self._build_maven_batch(sources, [], cancel_event)[1],
+                )
+            finally:
+                for path, text in sources.items():
+                    if not os.path.exists(path):
+                        self.create_test(path, text)
+
+    def _interrupted_output(self, result: CommandResult) -> Optional[MavenOutput]:
+        if not result.timed_out and not result.cancelled:
+            return None
+        out = MavenOutput([])
+        out.text = result.output
+        out.status = "failure"
+        reason = "timed out" if result.timed_out else "cancelled"
+        out.append(MavenOutputLine("error", f"`{' '.join(result.args)}` {reason} after {result.wall_time:.1f}s"))
+        return out
+
+    def _cancelled_output(self, request: str) -> MavenOutput:
+        out = MavenOutput([])
+        out.status = "failure"
+        out.append(MavenOutputLine("error", f"`{request}` cancelled"))
+        out.text = out.output[-1].msg
+        return out
+
+    def _read_test_report(self, out: MavenOutput, test_path: str):
+        """The generated test passes if its own test cases pass, whatever happened to the rest of the build."""
+        report = self.report_parser.load(self.get_module_path(test_path), self.get_test_class_name(test_path))
+        if report is None:
+            return
+        out.test_report = report
+        out.status = "success" if report.success else "failure"
+
+    def check(self, test_path: str, cancel_event: Optional[threading.Event] = None) -> MavenOutput:
+        """Validate the generated test at `test_path` in the configured mode."""
+        with self.instrumentation.span("check", project=self.project_path, mode=self.mode) as span:
+            out = self._check(test_path, cancel_event)
+            span.set(status=out.status, errors=len(out.filter("error")))
+        return out
+
+    def _check(self, test_path: str, cancel_event: Optional[threading.Event] = None) -> MavenOutput:
+        self.last_results = []
+        if self.mode == "focused":
+            return self.run_focused_test(test_path, cancel_event)
+        elif self.mode == "service":
+            return self.run_service_test(test_path, cancel_event)
+        else:
+            # stop the build once the compiler is done reporting the generated test
+            watch_path = os.path.relpath(os.path.abspath(test_path), os.path.abspath(self.project_path))
+            stream = self.mvn_parser.stream(watch_path=watch_path.replace("\\", "/"))
+            self.run_tests(cancel_event, on_line=stream.feed)
+            result = self.last_results[-1]
+            if result.timed_out or (result.cancelled and not stream.stopped):
+                return self._interrupted_output(result)
+            with self.instrumentation.span("parse_output", project=self.project_path, parser="maven", stopped_early=stream.stopped):
+                out = stream.finish()
+                if not stream.stopped:
+                    self._read_test_report(out, test_path)
+            return out
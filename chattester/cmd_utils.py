@@ -3,25 +3,197 @@
 # and is released under the "MIT License Agreement". Please see the LICENSE
 # file that should have been included as part of this package.
 
+import asyncio
 import os
-from subprocess import check_output, CalledProcessError, STDOUT
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional, Union
+
+from pydantic import BaseModel
+
+# longest output line the asyncio reader accepts
+MAX_LINE_SIZE = 1024 * 1024
+# called with each output line, returning True stops the command
+LineConsumer = Callable[[str], Optional[bool]]
+
+
+class CommandResult(BaseModel):
+    args: List[str]
+    output: str
+    returncode: Optional[int]
+    success: bool
+    timed_out: bool = False
+    cancelled: bool = False
+    wall_time: float = 0.0
+    output_size: int = 0
+    peak_output_size: int = 0
+
+
+def _resolve_args(command: Union[str, List[str]]) -> List[str]:
+    args = shlex.split(command) if isinstance(command, str) else list(command)
+    executable = shutil.which(args[0])
+    if executable is not None:
+        args[0] = executable
+    return args
+
+def _kill_process_group(process):
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class _OutputRecorder(object):
+    def __init__(self, on_line: Optional[LineConsumer], keep_output: bool) -> None:
+        self.on_line = on_line
+        self.keep_output = keep_output
+        self.lines: List[str] = []
+        self.output_size = 0
+        self.buffer_size = 0
+        self.peak_output_size = 0
+
+    def add(self, raw_line: bytes) -> bool:
+        """returns True if the consumer asked to stop"""
+        line = raw_line.decode("utf-8", errors="replace")
+        self.output_size += len(raw_line)
+        if self.keep_output:
+            self.lines.append(line)
+            self.buffer_size += len(raw_line)
+        self.peak_output_size = max(self.peak_output_size, self.buffer_size, len(raw_line))
+        if self.on_line is not None:
+            return bool(self.on_line(line))
+        return False
+
+    def result(self, args: List[str], returncode: Optional[int], timed_out: bool, cancelled: bool, start_time: float) -> CommandResult:
+        return CommandResult(
+            args=args,
+            output="".join(self.lines),
+            returncode=returncode,
+            success=returncode == 0 and not timed_out and not cancelled,
+            timed_out=timed_out,
+            cancelled=cancelled,
+            wall_time=time.perf_counter() - start_time,
+            output_size=self.output_size,
+            peak_output_size=self.peak_output_size,
+        )
+
+
+def run_command(command: Union[str, List[str]],
+        cwd: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_line: Optional[LineConsumer] = None,
+        keep_output: bool = True,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> CommandResult:
+    """
+    Run a command without a shell and without changing the working directory
+    of this process, safe to call from several threads.
+    params:
+        command: list of strings or a command line, ex. `["mvn", "verify"]`
+        cwd: working directory of the command
+        timeout: seconds before the command and its children are killed
+        on_line: called with each line of stdout and stderr as it is produced, returning True kills the command
+        keep_output: keep the output in `CommandResult.output`
+        cancel_event: kills the command when set
+    usage: result = run_command(["ls", "-l"], cwd="/tmp")
+    """
+    args = _resolve_args(command)
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        start_new_session=(os.name == "posix"),
+    )
+    recorder = _OutputRecorder(on_line, keep_output)
+    finished = threading.Event()
+    state = {"timed_out": False, "cancelled": False}
+
+    def watch():
+        deadline = None if timeout is None else start_time + timeout
+        while not finished.wait(0.05):
+            if deadline is not None and time.perf_counter() > deadline:
+                state["timed_out"] = True
+            elif cancel_event is not None and cancel_event.is_set():
+                state["cancelled"] = True
+            else:
+                continue
+            _kill_process_group(process)
+            return
+
+    watcher = None
+    if timeout is not None or cancel_event is not None:
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+    try:
+        for raw_line in process.stdout:
+            if recorder.add(raw_line):
+                state["cancelled"] = True
+                _kill_process_group(process)
+                break
+        process.stdout.close()
+        returncode = process.wait()
+    except BaseException:
+        _kill_process_group(process)
+        process.wait()
+        raise
+    finally:
+        finished.set()
+        if watcher is not None:
+            watcher.join()
+    return recorder.result(args, returncode, state["timed_out"], state["cancelled"], start_time)
+
+
+async def arun_command(command: Union[str, List[str]],
+        cwd: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_line: Optional[LineConsumer] = None,
+        keep_output: bool = True,
+    ) -> CommandResult:
+    """asyncio version of `run_command`, cancelling the task kills the command."""
+    args = _resolve_args(command)
+    start_time = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *args, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        start_new_session=(os.name == "posix"), limit=MAX_LINE_SIZE,
+    )
+    recorder = _OutputRecorder(on_line, keep_output)
+    timed_out = False
+    cancelled = False
+    try:
+        while True:
+            remaining = None if timeout is None else start_time + timeout - time.perf_counter()
+            try:
+                raw_line = await asyncio.wait_for(process.stdout.readline(), remaining)
+            except asyncio.TimeoutError:
+                timed_out = True
+                _kill_process_group(process)
+                break
+            if raw_line == b"":
+                break
+            if recorder.add(raw_line):
+                cancelled = True
+                _kill_process_group(process)
+                break
+        returncode = await process.wait()
+    except BaseException:
+        _kill_process_group(process)
+        await process.wait()
+        raise
+    return recorder.result(args, returncode, timed_out, cancelled, start_time)
+
 
 def system_call(command, cwd=None):
-    """ 
+    """
     params:
         command: list of strings, ex. `["ls", "-l"]`
     returns: output, success
     usage: output, success = system_call(["ls", "-l"])
     """
-    pwd = os.getcwd()
-    try:
-        if cwd is not None:
-            os.chdir(cwd)
-        output = check_output(command, stderr=STDOUT, shell=True).decode()
-        success = True 
-    except CalledProcessError as e:
-        output = e.output.decode()
-        success = False
-    finally:
-        os.chdir(pwd)
-    return output, success
+    result = run_command(command, cwd=cwd)
+    return result.output, result.success
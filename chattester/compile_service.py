@@ -0,0 +1,222 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import os
+import queue
+import subprocess
+import threading
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+SERVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "CompileServer.java")
+SEP = "\t"
+# seconds to wait for the server to compile itself and load the compiler
+STARTUP_TIMEOUT = 60.0
+# seconds to wait for a compile or test run when no timeout is given
+REQUEST_TIMEOUT = 120.0
+
+
+class Diagnostic(BaseModel):
+    # `error`, `warning`, `mandatory_warning`, `note` or `other`
+    kind: str
+    path: Optional[str] = None
+    line: Optional[int] = None
+    column: Optional[int] = None
+    message: str
+
+
+class CompileResult(BaseModel):
+    success: bool
+    diagnostics: List[Diagnostic] = []
+
+
+class TestFailure(BaseModel):
+    name: str
+    message: Optional[str] = None
+    trace: str = ""
+
+
+class TestRunResult(BaseModel):
+    success: bool
+    run_count: int = 0
+    failures: List[TestFailure] = []
+    error: Optional[str] = None
+
+
+class CompileServiceError(Exception):
+    pass
+
+class CompileServiceTimeout(CompileServiceError):
+    pass
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+
+def _unescape(text: str) -> str:
+    out = []
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == "\\" and i + 1 < len(text):
+            i += 1
+            c = {"n": "\n", "r": "\r", "t": "\t"}.get(text[i], text[i])
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+def _parse_position(value: str) -> Optional[int]:
+    number = int(value)
+    # javax.tools.Diagnostic.NOPOS
+    return number if number >= 0 else None
+
+
+class CompileService(object):
+    """
+    A warm JVM that compiles generated tests with the in-JDK compiler and runs
+    them with JUnit, for one module classpath. The server is started on first
+    use and restarted if it dies or stops answering.
+    usage:
+        with CompileService(classpath) as service:
+            result = service.compile("FooTest.java", text, "target/test-classes")
+    """
+    def __init__(self, classpath: str, java: str = "java", timeout: Optional[float] = REQUEST_TIMEOUT, cwd: Optional[str] = None) -> None:
+        """
+        params:
+            classpath: classpath used to compile and run the tests
+            java: java launcher of a JDK 11 or newer
+            timeout: seconds before a request is abandoned and the server restarted, a test that
+                never returns would otherwise hold the server forever
+            cwd: working directory of the server, where the tests run
+        """
+        self.classpath = classpath
+        self.java = java
+        self.timeout = timeout
+        self.cwd = cwd
+        self.restarts = 0
+
+        self._process: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "CompileService":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _read_stdout(self, process: subprocess.Popen, lines: "queue.Queue[Optional[str]]"):
+        for line in process.stdout:
+            lines.put(line.rstrip("\n"))
+        lines.put(None)
+
+    def start(self):
+        if self.alive:
+            return
+        self.stop()
+        self._lines = queue.Queue()
+        self._process = subprocess.Popen(
+            [self.java, SERVER_SOURCE, self.classpath],
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="utf-8",
+        )
+        threading.Thread(target=self._read_stdout, args=(self._process, self._lines), daemon=True).start()
+        # the first request compiles the server itself
+        self._send(["PING"], STARTUP_TIMEOUT)
+
+    def stop(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.write("EXIT\n")
+            self._process.stdin.flush()
+            self._process.wait(timeout=5)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def _send(self, request: List[str], timeout: Optional[float]) -> Tuple[List[List[str]], List[str]]:
+        """returns: response records, END record"""
+        try:
+            self._process.stdin.write("".join(field + "\n" for field in request))
+            self._process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise CompileServiceError(f"Failed to send request: {e}")
+
+        records = []
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                raise CompileServiceTimeout(f"No response after {timeout}s")
+            if line is None:
+                raise CompileServiceError("Compile server exited")
+            record = line.split(SEP)
+            if record[0] == "END":
+                return records, record
+            records.append(record)
+
+    def _request(self, request: List[str]) -> Tuple[List[List[str]], List[str]]:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    self.start()
+                    return self._send(request, self.timeout)
+                except CompileServiceError as e:
+                    print("Failed to talk to the compile server, restarting: ", e)
+                    if self._process is not None:
+                        self._process.kill()
+                        self._process.wait()
+                        self._process = None
+                    self.restarts += 1
+                    # a request that hangs would hang again
+                    if attempt == 1 or isinstance(e, CompileServiceTimeout):
+                        raise
+
+    def compile(self, source_path: str, source_text: str, output_dir: str) -> CompileResult:
+        """
+        Compile one source file into `output_dir`.
+        params:
+            source_path: path reported in the diagnostics
+        """
+        records, end = self._request(["COMPILE", _escape(output_dir), _escape(source_path), _escape(source_text)])
+        out = CompileResult(success=end[1] == "1")
+        for record in records:
+            if record[0] == "DIAG":
+                kind, line, column, path, message = record[1:6]
+                out.diagnostics.append(Diagnostic(
+                    kind=kind,
+                    path=_unescape(path) or None,
+                    line=_parse_position(line),
+                    column=_parse_position(column),
+                    message=_unescape(message),
+                ))
+            elif record[0] == "ERROR":
+                out.diagnostics.append(Diagnostic(kind="error", message=_unescape(record[1])))
+        return out
+
+    def run_tests(self, class_name: str) -> TestRunResult:
+        """Run the JUnit 4 test class `class_name` from the classpath."""
+        records, end = self._request(["RUN", _escape(class_name)])
+        out = TestRunResult(success=end[1] == "1", run_count=int(end[2]) if len(end) > 2 else 0)
+        for record in records:
+            if record[0] == "FAIL":
+                out.failures.append(TestFailure(
+                    name=_unescape(record[1]),
+                    message=_unescape(record[2]) or None,
+                    trace=_unescape(record[3]),
+                ))
+            elif record[0] == "ERROR":
+                out.error = _unescape(record[1])
+        return out
@@ -0,0 +1,144 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import collections
+import re
+from typing import List, Optional, Set, Tuple
+
+from chattester.instrumentation import count_tokens
+from chattester.source import ClassInfo, MethodInfo, UnitTestPair
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+CALL_PATTERN = re.compile(r"([A-Za-z_$][A-Za-z0-9_$]*)\s*\(")
+
+
+class SkeletonMember(object):
+    def __init__(self, name: str, text: str, model_name: Optional[str]) -> None:
+        self.name = name
+        self.text = text
+        self.model_name = model_name
+        self._tokens: Optional[int] = None
+
+    @property
+    def tokens(self) -> int:
+        """Counted on first use, only contexts with a token budget need it."""
+        if self._tokens is None:
+            # the newline and indentation joining the members
+            self._tokens = count_tokens(self.text + "\n", self.model_name)
+        return self._tokens
+
+
+class ClassSkeleton(object):
+    """Field declarations and method signatures of a focal class, with their token counts."""
+    def __init__(self, class_info: ClassInfo, model_name: Optional[str] = None) -> None:
+        self.name = class_info.name
+        self.fields = [SkeletonMember(field.name, field.text, model_name) for field in class_info.fields]
+        self.methods = [
+            SkeletonMember(method.name, " ".join(method.modifiers) + " " + method.declaration + ";", model_name)
+            for method in class_info.methods
+        ]
+
+
+def _get_references(method: MethodInfo) -> Tuple[Set[str], Set[str]]:
+    """returns: identifiers used by `method`, names of the methods it calls"""
+    return set(IDENTIFIER_PATTERN.findall(method.text)), set(CALL_PATTERN.findall(method.text))
+
+
+class FocalContextBuilder(object):
+    """
+    Builds the focal class context of the prompts: the fields and the other
+    method signatures of the focal class, then the focal method.
+    Class skeletons are computed once per class. With a `token_budget` the
+    members most relevant to the focal method are kept first (fields it
+    references, methods and constructors it calls, then the other
+    constructors), in declaration order, until the context reaches the budget.
+    The focal method is always kept.
+    """
+    def __init__(self, token_budget: Optional[int] = None, model_name: Optional[str] = None, max_skeletons: int = 1024) -> None:
+        """
+        params:
+            token_budget: maximum tokens of the context, unlimited if None
+            model_name: model whose tokenizer measures the context, the budget is an estimate from
+                the text length when tiktoken is not installed
+            max_skeletons: classes whose skeleton is kept
+        """
+        self.token_budget = token_budget
+        self.model_name = model_name
+        self.max_skeletons = max_skeletons
+        self._skeletons: "collections.OrderedDict[tuple, ClassSkeleton]" = collections.OrderedDict()
+
+    def get_skeleton(self, class_info: ClassInfo) -> ClassSkeleton:
+        key = (class_info.source.path, class_info.name, class_info.range.start_line)
+        skeleton = self._skeletons.get(key)
+        if skeleton is not None:
+            self._skeletons.move_to_end(key)
+            return skeleton
+        skeleton = ClassSkeleton(class_info, self.model_name)
+        self._skeletons[key] = skeleton
+        if len(self._skeletons) > self.max_skeletons:
+            self._skeletons.popitem(last=False)
+        return skeleton
+
+    def _format(self, class_name: str, fields: List[SkeletonMember], methods: List[SkeletonMember], focal_method: MethodInfo) -> str:
+        fields_str = "\n".join(field.text for field in fields)
+        methods_str = "\n".join(method.text for method in methods)
+        return f"""
+// Focal Class
+public class {class_name} {{
+    {fields_str}
+    {methods_str}
+    // Focal method
+    {focal_method.text}
+}}
+"""
+
+    def _select(self, skeleton: ClassSkeleton, fields: List[SkeletonMember], methods: List[SkeletonMember],
+            focal_method: MethodInfo, budget: int) -> Tuple[List[SkeletonMember], List[SkeletonMember]]:
+        identifiers, calls = _get_references(focal_method)
+        candidates = []
+        for i, field in enumerate(fields):
+            score = 2 if field.name in identifiers else 0
+            candidates.append((score, i, field))
+        for i, method in enumerate(methods):
+            if method.name in calls:
+                score = 2
+            elif method.name == skeleton.name or method.name in identifiers:
+                # constructors are needed to build the object under test
+                score = 1
+            else:
+                score = 0
+            candidates.append((score, len(fields) + i, method))
+
+        selected = set()
+        for score, index, member in sorted(candidates, key=lambda c: (-c[0], c[1])):
+            if member.tokens <= budget:
+                selected.add(index)
+                budget -= member.tokens
+        return (
+            [field for i, field in enumerate(fields) if i in selected],
+            [method for i, method in enumerate(methods) if len(fields) + i in selected],
+        )
+
+    def build(self, pair: UnitTestPair, token_budget: Optional[int] = None) -> str:
+        """
+        params:
+            token_budget: overrides the budget of the builder
+        """
+        if token_budget is None:
+            token_budget = self.token_budget
+        skeleton = self.get_skeleton(pair.focal_class)
+        fields = skeleton.fields
+        # overloads of the focal method are left out with it
+        methods = [method for method in skeleton.methods if method.name != pair.focal_method.name]
+        if token_budget is None:
+            return self._format(skeleton.name, fields, methods, pair.focal_method)
+
+        total = sum(member.tokens for member in fields) + sum(member.tokens for member in methods)
+        base_tokens = count_tokens(self._format(skeleton.name, [], [], pair.focal_method), self.model_name)
+        if base_tokens + total <= token_budget:
+            return self._format(skeleton.name, fields, methods, pair.focal_method)
+
+        fields, methods = self._select(skeleton, fields, methods, pair.focal_method, max(token_budget - base_tokens, 0))
+        return self._format(skeleton.name, fields, methods, pair.focal_method)
@@ -4,93 +4,96 @@
 # file that should have been included as part of this package.
 
 import os
-from typing import List, Optional
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import collections
+import fnmatch
 import glob
+import itertools
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
 import javalang
 import tqdm
 
-from chattester.javalang_utils import get_method_start_end, get_method_text
-from chattester.source import ClassInfo, LineRange, MethodInfo, SourceFile, SourceRange, UnitTestPair
+from chattester.cache import ExtractionCache
+from chattester.javalang_utils import JavaTokenScan
+from chattester.source import ClassInfo, FocalFileInfo, LineRange, MethodInfo, ParsedJavaFile, SourceRange, TestFileInfo, UnitTestPair
+from chattester.symbols import ProjectSymbolIndex, get_focal_class_candidates, get_package_name
+
+
+def get_possible_focal_method_name(test_method_name: str) -> str:
+    """`testFoo` tests `foo`, compared case-insensitively with the focal methods."""
+    if test_method_name.startswith("test"):
+        return test_method_name[4:].lower()
+    return test_method_name
+
+def may_have_focal_methods(test_method_names: Iterable[str], focal_method_names: Iterable[str]) -> bool:
+    focal_names = set(name.lower() for name in focal_method_names)
+    return any(get_possible_focal_method_name(name) in focal_names for name in test_method_names)
 
 
 class ProjectUnitTestExtractor:
-    def __init__(self, project_path: str) -> None:
+    def __init__(self, project_path: str, cache: Optional[ExtractionCache] = None) -> None:
         self.project_path = project_path
+        self.cache = cache
     
     def _get_all_test_source(self) -> List[str]:
         files = glob.glob(os.path.join(self.project_path, "**/src/test/**/*.java"), recursive=True)
         return list(files)
 
-    def _extract_test_methods(self, file_path: str) -> List[MethodInfo]:
+    def _get_all_main_source(self) -> List[str]:
+        files = glob.glob(os.path.join(self.project_path, "**/src/main/**/*.java"), recursive=True)
+        return list(files)
+
+    def _read_file(self, file_path: str) -> str:
         with open(file_path, "r", encoding="utf-8") as f:
-            codetext = f.read()
-        source = SourceFile(path=file_path, type="java", codetext=codetext)
+            return f.read()
 
-        tree = javalang.parse.parse(codetext)
+    def _parse_file(self, file_path: str, codetext: str, scan: Optional[JavaTokenScan] = None) -> Optional[ParsedJavaFile]:
+        try:
+            return ParsedJavaFile(file_path, codetext, scan.tokens if scan is not None else None)
+        except (javalang.parser.JavaSyntaxError, javalang.tokenizer.LexerError):
+            print("Failed to parse: " + file_path)
+            return None
 
+    def _scan_file(self, file_path: str, codetext: str) -> Optional[JavaTokenScan]:
+        try:
+            return JavaTokenScan(file_path, codetext)
+        except javalang.tokenizer.LexerError:
+            print("Failed to parse: " + file_path)
+            return None
+
+    def _extract_test_methods(self, parsed: ParsedJavaFile) -> List[MethodInfo]:
         out = []
-        lex = None
-        for path, node in tree.filter(javalang.tree.MethodDeclaration):
+        for path, node in parsed.tree.filter(javalang.tree.MethodDeclaration):
             if len(node.annotations) > 0:
                 if any([a.name == "Test" for a in node.annotations]):
                     out.append(
-                        MethodInfo.from_node(source=source, tree=tree, node=node, lex=lex)
+                        MethodInfo.from_node(parsed=parsed, node=node)
                     )
         return out
     
-    def _extract_methods(self, file_path: str) -> List[MethodInfo]:
-        with open(file_path, "r", encoding="utf-8") as f:
-            codetext = f.read()
-        source = SourceFile(path=file_path, type="java", codetext=codetext)
-
-        tree = javalang.parse.parse(codetext)
-
+    def _extract_methods(self, parsed: ParsedJavaFile) -> List[MethodInfo]:
         out = []
-        lex = None
-        for path, node in tree.filter(javalang.tree.MethodDeclaration):
+        for path, node in parsed.tree.filter(javalang.tree.MethodDeclaration):
             out.append(
-                MethodInfo.from_node(source=source, tree=tree, node=node, lex=lex)
+                MethodInfo.from_node(parsed=parsed, node=node)
             )
         return out
     
-    def _extract_package_info(self, file_path: str) -> str:
-        with open(file_path, "r", encoding="utf-8") as f:
-            codetext = f.read()
-        codelines = codetext.splitlines(keepends=True)
-        source = SourceFile(path=file_path, type="java", codetext=codetext)
-
-        try:
-            tree = javalang.parse.parse(codetext)
-        except:
-            print("Failed to parse: " + file_path)
-            return
-
+    def _extract_package_info(self, parsed: ParsedJavaFile) -> str:
         out = None
-        lex = None
-        for path, node in tree.filter(javalang.tree.PackageDeclaration):
-            startpos, endpos, startline, endline = get_method_start_end(tree, node)
-            package_text = codelines[startline - 1].strip()
+        for path, node in parsed.tree.filter(javalang.tree.PackageDeclaration):
+            startpos, endpos, startline, endline = parsed.spans.get(node)
+            package_text = parsed.codelines[startline - 1].strip()
             out = package_text
         return out
     
-    def _extract_imports(self, file_path: str) -> List[str]:
-        with open(file_path, "r", encoding="utf-8") as f:
-            codetext = f.read()
-        codelines = codetext.splitlines(keepends=True)
-        source = SourceFile(path=file_path, type="java", codetext=codetext)
-
-        try:
-            tree = javalang.parse.parse(codetext)
-        except:
-            print("Failed to parse: " + file_path)
-            return
-
+    def _extract_imports(self, parsed: ParsedJavaFile) -> List[str]:
         out = []
-        lex = None
-        for path, node in tree.filter(javalang.tree.Import):
-            startpos, endpos, startline, endline = get_method_start_end(tree, node)
-            import_text = codelines[startline - 1].strip()
+        for path, node in parsed.tree.filter(javalang.tree.Import):
+            startpos, endpos, startline, endline = parsed.spans.get(node)
+            import_text = parsed.codelines[startline - 1].strip()
             out.append(import_text)
         return out
     
@@ -106,62 +109,275 @@ class ProjectUnitTestExtractor:
         else:
             return None
     
-    def _get_focal_class(self, file_path: str) -> Optional[ClassInfo]:
-        file_path = os.path.normpath(file_path).replace("\\", "/")
-        with open(file_path, "r", encoding="utf-8") as f:
-            codetext = f.read()
-        source = SourceFile(path=file_path, type="java", codetext=codetext)
-
-        tree = javalang.parse.parse(codetext)
-
+    def _get_focal_class(self, parsed: ParsedJavaFile) -> Optional[ClassInfo]:
+        file_path = os.path.normpath(parsed.path).replace("\\", "/")
         core_class_name = file_path.split("/")[-1].replace(".java", "")
         
         out = None
-        for path, node in tree.filter(javalang.tree.ClassDeclaration):
+        for path, node in parsed.tree.filter(javalang.tree.ClassDeclaration):
             if node.name != core_class_name:
                 continue
-            out = ClassInfo.from_node(source, tree, node)
+            out = ClassInfo.from_node(parsed, node)
         return out
     
-    def get_all_tests(self) -> List[UnitTestPair]:
+    def _extract_focal_file(self, file_path: str, codetext: str, scan: Optional[JavaTokenScan] = None) -> Optional[FocalFileInfo]:
+        if self.cache is not None:
+            info = self.cache.load(file_path, codetext, FocalFileInfo)
+            if info is not None:
+                return info
+
+        parsed = self._parse_file(file_path, codetext, scan)
+        if parsed is None:
+            return None
+        info = FocalFileInfo(
+            package_info=self._extract_package_info(parsed),
+            imports=self._extract_imports(parsed),
+            focal_class=self._get_focal_class(parsed),
+            methods=self._extract_methods(parsed),
+        )
+        if self.cache is not None:
+            self.cache.store(file_path, codetext, info)
+        return info
+
+    def _extract_test_file(self, file_path: str, codetext: str, scan: Optional[JavaTokenScan] = None) -> Optional[TestFileInfo]:
+        if self.cache is not None:
+            info = self.cache.load(file_path, codetext, TestFileInfo)
+            if info is not None:
+                return info
+
+        if scan is None:
+            scan = self._scan_file(file_path, codetext)
+            if scan is None:
+                return None
+        if len(scan.test_method_names) == 0:
+            # helpers, fixtures and abstract bases have nothing to pair, no need to parse them
+            return TestFileInfo(package_info=None, imports=[], test_methods=[])
+
+        parsed = self._parse_file(file_path, codetext, scan)
+        if parsed is None:
+            return None
+        info = TestFileInfo(
+            package_info=self._extract_package_info(parsed),
+            imports=self._extract_imports(parsed),
+            test_methods=self._extract_test_methods(parsed),
+        )
+        if self.cache is not None:
+            self.cache.store(file_path, codetext, info)
+        return info
+
+    def _make_pairs(self, test_file: str, test_info: TestFileInfo, focal_info: FocalFileInfo,
+            find_focal_method: Callable[[str], Optional[MethodInfo]], method_name: Optional[str]) -> List[UnitTestPair]:
         out = []
-        test_files = self._get_all_test_source()
-        for test_file in tqdm.tqdm(test_files): 
-            focal_file = self._get_focal_file(test_file)
-            if focal_file is None:
+        if focal_info.focal_class is None:
+            return out
+
+        for method in test_info.test_methods:
+            focal_method = find_focal_method(get_possible_focal_method_name(method.name))
+            if focal_method is None:
+                continue
+            if method_name is not None and focal_method.name != method_name:
                 continue
-            
-            package_info = self._extract_package_info(focal_file)
-            imports = self._extract_imports(focal_file)
+            pair = UnitTestPair(
+                focal_class=focal_info.focal_class,
+                focal_method=focal_method,
+                test_path=test_file,
+                package_info=focal_info.package_info,
+                imports=focal_info.imports,
+            )
+            out.append(pair)
+        return out
 
-            focal_class = self._get_focal_class(focal_file)
-            focal_methods = self._extract_methods(focal_file)
-            test_methods = self._extract_test_methods(test_file)
+    def _get_tests_for_file(self, test_file: str, method_name: Optional[str] = None) -> List[UnitTestPair]:
+        focal_file = self._get_focal_file(test_file)
+        if focal_file is None:
+            return []
 
-            if focal_class is None:
-                continue
+        focal_codetext = self._read_file(focal_file)
+        if method_name is not None and method_name not in focal_codetext:
+            return []
+
+        # tokenize first, only files that can produce a pair are parsed
+        test_codetext = self._read_file(test_file)
+        test_info = self.cache.load(test_file, test_codetext, TestFileInfo) if self.cache is not None else None
+        if test_info is None:
+            test_scan = self._scan_file(test_file, test_codetext)
+            if test_scan is None or len(test_scan.test_method_names) == 0:
+                return []
+            test_method_names = test_scan.test_method_names
+        else:
+            test_scan = None
+            test_method_names = [method.name for method in test_info.test_methods]
+
+        focal_info = self.cache.load(focal_file, focal_codetext, FocalFileInfo) if self.cache is not None else None
+        if focal_info is None:
+            focal_scan = self._scan_file(focal_file, focal_codetext)
+            if focal_scan is None or not may_have_focal_methods(test_method_names, focal_scan.method_names):
+                return []
+            focal_info = self._extract_focal_file(focal_file, focal_codetext, focal_scan)
+        if test_info is None:
+            test_info = self._extract_test_file(test_file, test_codetext, test_scan)
+        if focal_info is None or test_info is None:
+            return []
+
+        def find_focal_method(name: str) -> Optional[MethodInfo]:
+            for each_focal_method in focal_info.methods:
+                if each_focal_method.name.lower() == name:
+                    return each_focal_method
+            return None
+
+        return self._make_pairs(test_file, test_info, focal_info, find_focal_method, method_name)
+
+    def _get_tests_from_index(self, test_file: str, test_info: TestFileInfo, symbol_index: ProjectSymbolIndex,
+            method_name: Optional[str] = None) -> List[UnitTestPair]:
+        test_class_name = os.path.normpath(test_file).replace("\\", "/").split("/")[-1].replace(".java", "")
+        package_name = get_package_name(test_info.package_info)
+
+        qualified_name = None
+        for class_name in get_focal_class_candidates(test_class_name):
+            qualified_name = symbol_index.resolve_class(class_name, package_name, test_info.imports)
+            if qualified_name is not None:
+                break
+        if qualified_name is None:
+            return []
+
+        def find_focal_method(name: str) -> Optional[MethodInfo]:
+            methods = symbol_index.find_methods(qualified_name, name)
+            return methods[0] if len(methods) > 0 else None
+
+        return self._make_pairs(test_file, test_info, symbol_index.classes[qualified_name], find_focal_method, method_name)
+
+    def _safe_get_tests_for_files(self, test_files: List[str], method_name: Optional[str] = None) -> List[Tuple[List[UnitTestPair], Optional[str]]]:
+        out = []
+        for test_file in test_files:
+            try:
+                out.append((self._get_tests_for_file(test_file, method_name), None))
+            except Exception:
+                out.append(([], traceback.format_exc()))
+        return out
 
-            for method in test_methods:
-                if method.name.startswith("test"):
-                    possible_focal_method_name = method.name[4:].lower()
-                else:
-                    possible_focal_method_name = method.name
-                
-                focal_method = None
-                for each_focal_method in focal_methods:
-                    if each_focal_method.name.lower() == possible_focal_method_name:
-                        focal_method = each_focal_method
-                        break
-                
-                if focal_method is None:
+    def _safe_extract_test_files(self, test_files: List[str]) -> List[Tuple[Optional[TestFileInfo], Optional[str]]]:
+        out = []
+        for test_file in test_files:
+            try:
+                out.append((self._extract_test_file(test_file, self._read_file(test_file)), None))
+            except Exception:
+                out.append((None, traceback.format_exc()))
+        return out
+
+    def _safe_extract_focal_files(self, focal_files: List[str]) -> List[Tuple[Optional[FocalFileInfo], Optional[str]]]:
+        out = []
+        for focal_file in focal_files:
+            try:
+                out.append((self._extract_focal_file(focal_file, self._read_file(focal_file)), None))
+            except Exception:
+                out.append((None, traceback.format_exc()))
+        return out
+
+    def _filter_test_files(self, test_files: List[str], path_glob: Optional[str], class_name: Optional[str]) -> List[str]:
+        out = []
+        for test_file in test_files:
+            if path_glob is not None and not fnmatch.fnmatch(os.path.normpath(test_file).replace("\\", "/"), path_glob):
+                continue
+            if class_name is not None:
+                focal_file = self._get_focal_file(test_file)
+                if focal_file is None or focal_file.split("/")[-1] != class_name + ".java":
                     continue
-                pair = UnitTestPair(
-                    focal_class=focal_class,
-                    focal_method=focal_method,
-                    test_path=test_file,
-                    package_info=package_info,
-                    imports=imports,
-                )
-                out.append(pair)
-
-        return out
\ No newline at end of file
+            out.append(test_file)
+        return out
+
+    def _iter_chunk_results(self, files: List[str], num_workers: int, chunksize: int, fn: Callable, *args) -> Iterator[list]:
+        chunks = [files[i:i + chunksize] for i in range(0, len(files), chunksize)]
+        if num_workers <= 1:
+            for chunk in chunks:
+                yield fn(chunk, *args)
+            return
+
+        # bounded window of in-flight chunks, so memory stays flat while keeping order
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            pending = collections.deque()
+            chunk_iter = iter(chunks)
+            for chunk in itertools.islice(chunk_iter, 2 * num_workers):
+                pending.append(executor.submit(fn, chunk, *args))
+            while len(pending) > 0:
+                results = pending.popleft().result()
+                for chunk in itertools.islice(chunk_iter, 1):
+                    pending.append(executor.submit(fn, chunk, *args))
+                yield results
+
+    def iter_tests(self,
+            num_workers: int = 1,
+            chunksize: int = 1,
+            path_glob: Optional[str] = None,
+            class_name: Optional[str] = None,
+            method_name: Optional[str] = None,
+            symbol_index: Optional[ProjectSymbolIndex] = None,
+        ) -> Iterator[UnitTestPair]:
+        """
+        params:
+            num_workers: number of worker processes, `1` extracts in the current process
+            chunksize: number of test files sent to a worker at a time
+            path_glob: only test files whose path matches this glob
+            class_name: only pairs whose focal class has this name
+            method_name: only pairs whose focal method has this name
+            symbol_index: resolve focal classes project-wide instead of by the `src/main` path of the test file
+        returns: unit test pairs as each test file is processed, in the same order for any number of workers
+        """
+        if symbol_index is None:
+            test_files = self._filter_test_files(self._get_all_test_source(), path_glob, class_name)
+            chunk_results = self._iter_chunk_results(test_files, num_workers, chunksize,
+                self._safe_get_tests_for_files, method_name)
+        else:
+            test_files = self._filter_test_files(self._get_all_test_source(), path_glob, None)
+            chunk_results = self._iter_chunk_results(test_files, num_workers, chunksize,
+                self._safe_extract_test_files)
+        try:
+            with tqdm.tqdm(total=len(test_files)) as progress:
+                chunk_start = 0
+                for results in chunk_results:
+                    for test_file, (result, error) in zip(test_files[chunk_start:], results):
+                        if error is not None:
+                            print("Failed to extract: " + test_file + "\n" + error)
+                        if symbol_index is None:
+                            yield from result
+                        elif result is not None:
+                            for pair in self._get_tests_from_index(test_file, result, symbol_index, method_name):
+                                if class_name is None or pair.focal_class.name == class_name:
+                                    yield pair
+                    chunk_start += len(results)
+                    progress.update(len(results))
+        finally:
+            if self.cache is not None:
+                self.cache.evict()
+
+    def build_symbol_index(self, num_workers: int = 1, chunksize: int = 1) -> ProjectSymbolIndex:
+        """
+        Extract every `src/main` java file of the project into a ProjectSymbolIndex,
+        reusing the extraction cache when there is one.
+        """
+        index = ProjectSymbolIndex()
+        focal_files = sorted(self._get_all_main_source())
+        try:
+            with tqdm.tqdm(total=len(focal_files)) as progress:
+                chunk_start = 0
+                for results in self._iter_chunk_results(focal_files, num_workers, chunksize, self._safe_extract_focal_files):
+                    for focal_file, (info, error) in zip(focal_files[chunk_start:], results):
+                        if error is not None:
+                            print("Failed to extract: " + focal_file + "\n" + error)
+                        if info is not None:
+                            index.add(info)
+                    chunk_start += len(results)
+                    progress.update(len(results))
+        finally:
+            if self.cache is not None:
+                self.cache.evict()
+        return index
+
+    def get_all_tests(self, num_workers: int = 1, chunksize: int = 1, symbol_index: Optional[ProjectSymbolIndex] = None) -> List[UnitTestPair]:
+        """
+        params:
+            num_workers: number of worker processes, `1` extracts in the current process
+            chunksize: number of test files sent to a worker at a time
+            symbol_index: resolve focal classes project-wide instead of by the `src/main` path of the test file
+        returns: unit test pairs, in the same order for any number of workers
+        """
+        return list(self.iter_tests(num_workers=num_workers, chunksize=chunksize, symbol_index=symbol_index))
@@ -0,0 +1,216 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import contextlib
+import contextvars
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# characters per token of the fallback estimate, close to the OpenAI tokenizers on code
+CHARS_PER_TOKEN = 4
+
+
+class Span(BaseModel):
+    name: str
+    span_id: str
+    parent_id: Optional[str] = None
+    # id of the outermost span, one per generated pair
+    trace_id: str
+    project: Optional[str] = None
+    start_time: float
+    duration: float = 0.0
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = {}
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("chattester_span", default=None)
+
+_encodings: Dict[str, Any] = {}
+
+def _get_encoding(model_name: Optional[str]) -> Any:
+    """returns: tiktoken encoding of the model, None if it cannot be loaded, ex. offline on first use"""
+    key = model_name or ""
+    if key not in _encodings:
+        try:
+            try:
+                _encodings[key] = tiktoken.encoding_for_model(model_name) if model_name else tiktoken.get_encoding("cl100k_base")
+            except KeyError:
+                _encodings[key] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print("Failed to load the tokenizer, estimating token counts: ", e)
+            _encodings[key] = None
+    return _encodings[key]
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """Tokens of `text` with tiktoken when its encoding can be loaded, estimated from its length otherwise."""
+    encoding = _get_encoding(model_name) if tiktoken is not None else None
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class SpanExporter(object):
+    def export(self, span: Span):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """Appends every finished span as one JSON object per line."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        line = span.json()
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MemoryExporter(SpanExporter):
+    """Keeps finished spans in memory, ex. for `summarize`."""
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class Instrumentation(object):
+    """
+    Records timed spans of the generation pipeline and hands them to the
+    exporters when they end. Without exporters nothing is recorded.
+    Spans started inside another span, in the same thread or asyncio task,
+    become its children and share its trace and project.
+    usage:
+        instrumentation = Instrumentation([JsonLinesExporter("spans.jsonl")])
+        with instrumentation.span("llm", model="gpt-3.5-turbo") as span:
+            span.set(prompt_tokens=100)
+    """
+    def __init__(self, exporters: Optional[List[SpanExporter]] = None) -> None:
+        self.exporters = exporters if exporters is not None else []
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.exporters) > 0
+
+    @contextlib.contextmanager
+    def span(self, name: str, project: Optional[str] = None, **attributes) -> Iterator[Span]:
+        parent = _current_span.get()
+        span_id = uuid.uuid4().hex
+        span = Span(
+            name=name,
+            span_id=span_id,
+            parent_id=parent.span_id if parent is not None else None,
+            trace_id=parent.trace_id if parent is not None else span_id,
+            # children belong to the project of their trace
+            project=parent.project if parent is not None and parent.project is not None else project,
+            start_time=time.time(),
+            attributes=attributes,
+        )
+        if not self.enabled:
+            yield span
+            return
+
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+def load_spans(path: str) -> List[Span]:
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip() != "":
+                spans.append(Span.parse_raw(line))
+    return spans
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    index = min(int(q * len(values)), len(values) - 1)
+    return values[index]
+
+def summarize(spans: Iterable[Span]) -> Dict[str, Any]:
+    """
+    Aggregate spans per project: duration statistics per span name, token
+    totals of the `llm` spans, and repair rounds and outcomes of the
+    `generate` spans.
+    """
+    durations: Dict[str, Dict[str, List[float]]] = {}
+    projects: Dict[str, Dict[str, Any]] = {}
+    for span in spans:
+        project = span.project or ""
+        if project not in projects:
+            projects[project] = {
+                "pairs": 0, "outcomes": {}, "repair_rounds": 0, "errors": 0,
+                "llm_calls": 0, "cached_llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            }
+        summary = projects[project]
+        durations.setdefault(project, {}).setdefault(span.name, []).append(span.duration)
+        if span.error is not None:
+            summary["errors"] += 1
+
+        if span.name == "llm":
+            summary["llm_calls"] += 1
+            if span.attributes.get("cached", False):
+                # replayed answers cost nothing
+                summary["cached_llm_calls"] += 1
+                continue
+            summary["prompt_tokens"] += span.attributes.get("prompt_tokens", 0)
+            summary["completion_tokens"] += span.attributes.get("completion_tokens", 0)
+        elif span.name == "generate":
+            summary["pairs"] += 1
+            summary["repair_rounds"] += span.attributes.get("repair_rounds", 0)
+            outcome = span.attributes.get("outcome", "unknown")
+            summary["outcomes"][outcome] = summary["outcomes"].get(outcome, 0) + 1
+
+    for project, summary in projects.items():
+        summary["stages"] = {
+            name: {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": _percentile(values, 0.5),
+                "p95": _percentile(values, 0.95),
+                "max": max(values),
+            }
+            for name, values in durations[project].items()
+        }
+    return projects
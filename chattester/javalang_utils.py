@@ -3,6 +3,10 @@
 # and is released under the "MIT License Agreement". Please see the LICENSE
 # file that should have been included as part of this package.
 
+import bisect
+import re
+from typing import List, Optional, Tuple
+
 import javalang as jl
 
 def get_method_start_end(tree, method_node):
@@ -20,42 +24,274 @@ def get_method_start_end(tree, method_node):
             startline = node.position.line if node.position is not None else None
     return startpos, endpos, startline, endline
 
-def get_method_text(codelines, startpos, endpos, startline, endline, last_endline_index):
-    if startpos is None:
-        return "", None, None, None
-    else:
-        startline_index = startline - 1 
-        endline_index = endline - 1 if endpos is not None else None 
-
-        # 1. check for and fetch annotations
-        if last_endline_index is not None:
-            for line in codelines[(last_endline_index + 1):(startline_index)]:
-                if "@" in line:
-                    idx = line.find("@")
-                    if line[:idx].strip() != "":
-                        continue
-                    startline_index = startline_index - 1
-        meth_text = "<ST>".join(codelines[startline_index:endline_index])
-        meth_text = meth_text[:meth_text.rfind("}") + 1] 
-
-        # 2. remove trailing rbrace for last methods & any external content/comments
-        # if endpos is None and 
-        if not abs(meth_text.count("}") - meth_text.count("{")) == 0:
-            # imbalanced braces
-            brace_diff = abs(meth_text.count("}") - meth_text.count("{"))
-
-            for _ in range(brace_diff):
-                meth_text  = meth_text[:meth_text.rfind("}")]
-                meth_text  = meth_text[:meth_text.rfind("}") + 1]
-        
-        # if "/*" in meth_text and "}" in meth_text:
-        #     if meth_text.rfind("}") < meth_text.rfind("/*"):
-        #         meth_text  = meth_text[:meth_text.rfind("/*")]
-        if "/*" in meth_text and "}" in meth_text:
-            meth_text  = meth_text[:meth_text.rfind("/*")]
-
-        meth_lines = meth_text.split("<ST>")
-        meth_text  = "".join(meth_lines)                   
-        last_endline_index = startline_index + (len(meth_lines) - 1) 
-
-        return meth_text, (startline_index + 1), (last_endline_index + 1), last_endline_index
\ No newline at end of file
+class NodeSpanIndex(object):
+    """
+    Start and end positions of every node in a compilation unit, computed in a
+    single walk. `get(node)` returns the same tuple as `get_method_start_end`.
+    """
+    def __init__(self, tree) -> None:
+        self._spans = {}
+        open_nodes = []
+        for path, node in tree:
+            ancestors = set(id(p) for p in path)
+            while len(open_nodes) > 0 and id(open_nodes[-1]) not in ancestors:
+                self._close(open_nodes.pop(), node.position)
+            if id(node) in self._spans or node.position is None:
+                continue
+            self._spans[id(node)] = (node.position, None, node.position.line, None)
+            open_nodes.append(node)
+        # keep the nodes alive so that their ids stay valid
+        self._tree = tree
+
+    def _close(self, node, endpos) -> None:
+        startpos, _, startline, _ = self._spans[id(node)]
+        endline = endpos.line if endpos is not None else None
+        self._spans[id(node)] = (startpos, endpos, startline, endline)
+
+    def get(self, node):
+        return self._spans.get(id(node), (None, None, None, None))
+
+BRACKETS = {"(": ")", "{": "}", "[": "]"}
+# tokens ending the previous member, statement or block
+MEMBER_BOUNDARIES = ("{", "}", ";")
+
+class TokenSpanIndex(object):
+    """
+    Source text of declarations from the token stream of a file. Brackets are
+    matched once over the tokens, so braces in strings and comments do not
+    count. A declaration runs from its attached Javadoc, annotations and
+    modifiers to its closing brace, or semicolon for fields and abstract methods.
+    """
+    def __init__(self, codetext: str, tokens) -> None:
+        self.codetext = codetext
+        self.tokens = tokens
+        self._line_offsets = [0]
+        for line in codetext.splitlines(keepends=True):
+            self._line_offsets.append(self._line_offsets[-1] + len(line))
+
+        self._index = {}
+        self._match = {}
+        stack = []
+        for i, token in enumerate(tokens):
+            if token.position is not None:
+                self._index.setdefault((token.position.line, token.position.column), i)
+            if not isinstance(token, jl.tokenizer.Separator):
+                continue
+            if token.value in BRACKETS:
+                stack.append(i)
+            elif token.value in BRACKETS.values() and len(stack) > 0 and BRACKETS[tokens[stack[-1]].value] == token.value:
+                open_index = stack.pop()
+                self._match[open_index] = i
+                self._match[i] = open_index
+
+    def _offset(self, token) -> int:
+        return self._line_offsets[token.position.line - 1] + token.position.column - 1
+
+    def _line(self, offset: int) -> int:
+        return bisect.bisect_right(self._line_offsets, offset)
+
+    def _is_separator(self, index: int, values) -> bool:
+        token = self.tokens[index]
+        return isinstance(token, jl.tokenizer.Separator) and token.value in values
+
+    def _find_start(self, index: int) -> int:
+        """First token of the declaration whose node starts at `index`: annotations and modifiers come before it."""
+        start = index
+        i = index - 1
+        while i >= 0 and not self._is_separator(i, MEMBER_BOUNDARIES):
+            if self._is_separator(i, ")"):
+                # annotation arguments
+                i = self._match.get(i, i)
+            start = i
+            i -= 1
+        return start
+
+    def _find_end(self, index: int, has_body: bool) -> int:
+        i = index
+        while i < len(self.tokens):
+            if self._is_separator(i, ";"):
+                return i
+            if self._is_separator(i, "}"):
+                # unbalanced, the declaration ends with the enclosing block
+                return i - 1
+            if self._is_separator(i, "{") and has_body:
+                return self._match.get(i, len(self.tokens) - 1)
+            if self._is_separator(i, BRACKETS) and i in self._match:
+                # parameters, array dimensions and initializers
+                i = self._match[i]
+            i += 1
+        return len(self.tokens) - 1
+
+    def get(self, node, has_body: bool = True) -> Optional[Tuple[str, int, int]]:
+        """
+        params:
+            has_body: the declaration ends with its first top-level block, false for fields
+        returns: text, first and last line of the declaration, None if the node has no position
+        """
+        if node.position is None:
+            return None
+        index = self._index.get((node.position.line, node.position.column))
+        if index is None:
+            return None
+        start = self._find_start(index)
+        end = self._find_end(index, has_body)
+
+        start_offset = self._offset(self.tokens[start])
+        javadoc = getattr(self.tokens[start], "javadoc", None)
+        if javadoc is not None:
+            previous_end = 0
+            if start > 0:
+                previous_end = self._offset(self.tokens[start - 1]) + len(self.tokens[start - 1].value)
+            javadoc_offset = self.codetext.rfind(javadoc, previous_end, start_offset)
+            if javadoc_offset >= 0:
+                start_offset = javadoc_offset
+        end_offset = self._offset(self.tokens[end]) + len(self.tokens[end].value)
+
+        # keep the indentation when the declaration starts its line
+        line_start = self._line_offsets[self._line(start_offset) - 1]
+        if self.codetext[line_start:start_offset].strip() == "":
+            text_start = line_start
+        else:
+            text_start = start_offset
+        return self.codetext[text_start:end_offset], self._line(start_offset), self._line(end_offset - 1)
+
+# `Expected ';'` and `Expected Identifier` are raised by `accept` after it consumed the unexpected token
+ACCEPT_ERROR_PATTERN = re.compile(r"^Expected ('.*'|[A-Z]\w*)$")
+
+def get_bracket_errors(tokens):
+    """
+    returns: list of (line, message) for brackets without their pair
+    """
+    errors = []
+    stack = []
+    for token in tokens:
+        if not isinstance(token, jl.tokenizer.Separator):
+            continue
+        if token.value in BRACKETS:
+            stack.append(token)
+        elif token.value in BRACKETS.values():
+            if len(stack) > 0 and BRACKETS[stack[-1].value] == token.value:
+                stack.pop()
+            else:
+                errors.append((token.position.line, f"Unmatched '{token.value}'"))
+                # a stray bracket would make every following one look unmatched
+                break
+    if len(errors) == 0:
+        for token in stack:
+            errors.append((token.position.line, f"'{token.value}' is never closed"))
+    return errors
+
+def get_syntax_errors(codetext: str, parse: bool = False):
+    """
+    Check java source with the javalang tokenizer, without a compiler.
+    params:
+        parse: also report javalang parse errors, javalang only knows Java 8 so
+            valid newer syntax, ex. switch expressions and text blocks, is reported too
+    returns: list of (line, message), empty if the source has no error found
+    """
+    try:
+        tokens = list(jl.tokenizer.tokenize(codetext))
+    except jl.tokenizer.LexerError as e:
+        match = re.search(r"line ([0-9]+)", str(e))
+        line = int(match.group(1)) if match else 1
+        return [(line, str(e).split(", line")[0])]
+
+    errors = get_bracket_errors(tokens)
+    if len(errors) > 0 or not parse:
+        return errors
+
+    try:
+        jl.parser.Parser(tokens).parse()
+    except jl.parser.JavaSyntaxError as e:
+        last_line = max(len(codetext.splitlines()), 1)
+        # the lookahead when the error was raised
+        index = next((i for i, t in enumerate(tokens) if t is e.at), len(tokens))
+        if ACCEPT_ERROR_PATTERN.match(e.description) and index > 1:
+            # like javac, report a missing token after the last token that was accepted
+            line = tokens[index - 2].position.line
+        elif e.description.startswith("Expected") and index > 0:
+            line = tokens[index - 1].position.line
+        elif getattr(e.at, "position", None) is not None:
+            line = e.at.position.line
+        else:
+            line = last_line
+        return [(line, e.description)]
+    return []
+
+# tokens that can precede the name of a method declaration: its return type or, for generic and array types, their end
+RETURN_TYPE_END = (">", ">>", ">>>", "]", "void")
+CLASS_KEYWORDS = ("class", "interface", "enum")
+
+class JavaTokenScan(object):
+    """
+    Class names, declared method names and `@Test` method names of a java
+    file from its tokens only, to skip the full parse of files that cannot
+    produce a pair. A superset of what the parser finds: constructors and
+    annotations named `Test` in any package are included.
+    """
+    def __init__(self, path: str, codetext: str) -> None:
+        self.path = path
+        self.codetext = codetext
+        self.tokens = list(jl.tokenizer.tokenize(codetext))
+        self.class_names: List[str] = []
+        self.method_names: List[str] = []
+        self.test_method_names: List[str] = []
+        self._scan()
+
+    def _skip_parentheses(self, i: int) -> int:
+        """returns: index after the parentheses opening at `i`"""
+        depth = 0
+        while i < len(self.tokens):
+            value = self.tokens[i].value
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return i
+
+    def _scan(self):
+        tokens = self.tokens
+        # annotations since the last declaration or statement
+        annotations = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if isinstance(token, jl.tokenizer.Annotation):
+                if i + 1 < len(tokens) and tokens[i + 1].value == "interface":
+                    # `@interface` declares an annotation type
+                    i += 1
+                    continue
+                i += 1
+                name = None
+                while i < len(tokens) and isinstance(tokens[i], jl.tokenizer.Identifier):
+                    name = tokens[i].value
+                    if i + 1 < len(tokens) and tokens[i + 1].value == ".":
+                        i += 2
+                    else:
+                        i += 1
+                        break
+                if name is not None:
+                    annotations.append(name)
+                if i < len(tokens) and tokens[i].value == "(":
+                    i = self._skip_parentheses(i)
+                continue
+
+            if isinstance(token, jl.tokenizer.Keyword) and token.value in CLASS_KEYWORDS:
+                # not `Foo.class`
+                if (i == 0 or tokens[i - 1].value != ".") and i + 1 < len(tokens) and isinstance(tokens[i + 1], jl.tokenizer.Identifier):
+                    self.class_names.append(tokens[i + 1].value)
+                    annotations = []
+            elif isinstance(token, jl.tokenizer.Identifier) and i > 0 and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+                previous = tokens[i - 1]
+                if isinstance(previous, (jl.tokenizer.Identifier, jl.tokenizer.BasicType, jl.tokenizer.Modifier)) \
+                        or previous.value in RETURN_TYPE_END:
+                    self.method_names.append(token.value)
+                    if "Test" in annotations:
+                        self.test_method_names.append(token.value)
+                    annotations = []
+            elif token.value in (";", "{", "}"):
+                annotations = []
+            i += 1
@@ -0,0 +1,284 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from chattester.cache import ResponseCache
+from chattester.source import UnitTestPair
+from chattester.tester import ChatGPTUnitTestGenerator, GenerationResult
+
+JOB_STATES = ("pending", "generating", "validating", "passed", "failed")
+# states of jobs that were running when the runner stopped
+RUNNING_STATES = ("generating", "validating")
+# caps of the response cache a JobRunner creates for a generator without one
+DEFAULT_CACHE_ENTRIES = 100000
+DEFAULT_CACHE_BYTES = 1024 ** 3
+JOB_COLUMNS = "job_id, test_path, focal_class, focal_method, state, rounds, attempts, test, transcript, error, updated"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    test_path TEXT NOT NULL,
+    focal_class TEXT NOT NULL,
+    focal_method TEXT NOT NULL,
+    state TEXT NOT NULL,
+    rounds INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    test TEXT,
+    transcript TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, position);
+"""
+
+
+def get_job_id(pair: UnitTestPair) -> str:
+    """Stable id of a pair across extractions of the same project."""
+    return json.dumps([
+        os.path.normpath(pair.test_path).replace("\\", "/"),
+        pair.focal_class.name,
+        pair.focal_method.declaration,
+    ])
+
+
+class Job(BaseModel):
+    job_id: str
+    test_path: str
+    focal_class: str
+    focal_method: str
+    state: str
+    rounds: int = 0
+    attempts: int = 0
+    test: Optional[str] = None
+    transcript: List[Tuple[str, str]] = []
+    error: Optional[str] = None
+    updated: float = 0.0
+
+
+class JobQueue(object):
+    """
+    Generation state of every pair of a project in a SQLite database, updated
+    as soon as it changes so that a run can stop at any time.
+    Jobs go from `pending` to `generating` and `validating`, alternately
+    while their test is repaired, and end `passed` or `failed`.
+    """
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def add(self, pairs: List[UnitTestPair]) -> int:
+        """
+        Queue the pairs that are not in the queue yet.
+        returns: number of new jobs
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            position = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM jobs").fetchone()[0]
+            added = 0
+            for pair in pairs:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (job_id, position, test_path, focal_class, focal_method, state, updated) "
+                    "VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                    (get_job_id(pair), position, pair.test_path, pair.focal_class.name, pair.focal_method.declaration, now),
+                )
+                if cursor.rowcount > 0:
+                    position += 1
+                    added += 1
+        return added
+
+    def reset_interrupted(self) -> int:
+        """
+        Put back the jobs that were running when the last run stopped.
+        returns: number of jobs put back
+        """
+        placeholders = ", ".join("?" * len(RUNNING_STATES))
+        cursor = self._execute(
+            f"UPDATE jobs SET state = 'pending', updated = ? WHERE state IN ({placeholders})",
+            (time.time(),) + RUNNING_STATES,
+        )
+        return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """Put back the failed jobs, ex. after changing the prompts."""
+        cursor = self._execute(
+            "UPDATE jobs SET state = 'pending', rounds = 0, attempts = 0, error = NULL, updated = ? WHERE state = 'failed'",
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+    def claim(self, job_ids: Optional[Set[str]] = None) -> Optional[str]:
+        """
+        Take the first pending job, among `job_ids` if given.
+        returns: the job id, None if no job is pending
+        """
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT job_id FROM jobs WHERE state = 'pending' ORDER BY position")
+            for (job_id,) in rows:
+                if job_ids is not None and job_id not in job_ids:
+                    continue
+                cursor = conn.execute(
+                    "UPDATE jobs SET state = 'generating', attempts = attempts + 1, updated = ? WHERE job_id = ? AND state = 'pending'",
+                    (time.time(), job_id),
+                )
+                if cursor.rowcount > 0:
+                    rows.close()
+                    return job_id
+        return None
+
+    def update(self, job_id: str, state: str, result: GenerationResult):
+        self._execute(
+            "UPDATE jobs SET state = ?, rounds = ?, test = ?, transcript = ?, updated = ? WHERE job_id = ?",
+            (state, result.repair_rounds, result.test, json.dumps(result.transcript), time.time(), job_id),
+        )
+
+    def finish(self, job_id: str, result: GenerationResult):
+        self.update(job_id, "passed" if result.outcome == "passed" else "failed", result)
+
+    def release(self, job_id: str, error: str, max_attempts: int):
+        """Put back a job whose generation raised, or fail it after `max_attempts`."""
+        self._execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ?, updated = ? WHERE job_id = ?",
+            (max_attempts, error, time.time(), job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._to_job(row)
+
+    def jobs(self, state: Optional[str] = None) -> List[Job]:
+        if state is None:
+            cursor = self._execute(f"SELECT {JOB_COLUMNS} FROM jobs ORDER BY position")
+        else:
+            cursor = self._execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE state = ? ORDER BY position", (state,))
+        return [self._to_job(row) for row in cursor.fetchall()]
+
+    def _to_job(self, row: tuple) -> Job:
+        job_id, test_path, focal_class, focal_method, state, rounds, attempts, test, transcript, error, updated = row
+        return Job(
+            job_id=job_id, test_path=test_path, focal_class=focal_class, focal_method=focal_method,
+            state=state, rounds=rounds, attempts=attempts, test=test,
+            transcript=json.loads(transcript) if transcript is not None else [],
+            error=error, updated=updated,
+        )
+
+    def counts(self) -> Dict[str, int]:
+        counts = {state: 0 for state in JOB_STATES}
+        for state, count in self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall():
+            counts[state] = count
+        return counts
+
+
+class JobRunner(object):
+    """
+    Runs `aiterative_generate` over the pairs of a project with a pool of
+    workers, recording every pair in a JobQueue. Running again with the same
+    queue skips the pairs that are done and restarts the ones that were
+    interrupted. Model answers go through a response cache, so the model
+    calls an interrupted pair already made are replayed instead of paid again:
+    a generator without a cache is given `response_cache`, or a capped one
+    next to the database.
+    usage:
+        runner = JobRunner(generator, JobQueue("jobs.db"), num_workers=4)
+        runner.run(extractor.get_all_tests())
+    """
+    def __init__(self,
+            generator: ChatGPTUnitTestGenerator,
+            queue: JobQueue,
+            num_workers: int = 4,
+            max_n: int = 2,
+            max_attempts: int = 3,
+            response_cache: Optional[ResponseCache] = None,
+        ) -> None:
+        """
+        params:
+            num_workers: pairs generated at the same time, also the limit of model requests in flight
+            max_n: maximum number of repair rounds per pair
+            max_attempts: runs of a pair that raised before it is marked failed
+            response_cache: set on the generator when it has no cache, by default one at `<database>-responses`
+                capped at `DEFAULT_CACHE_ENTRIES` and `DEFAULT_CACHE_BYTES`
+        """
+        self.generator = generator
+        self.queue = queue
+        self.num_workers = num_workers
+        self.max_n = max_n
+        self.max_attempts = max_attempts
+        if self.generator.response_cache is None:
+            if response_cache is None:
+                response_cache = ResponseCache(
+                    os.path.splitext(queue.db_path)[0] + "-responses",
+                    max_entries=DEFAULT_CACHE_ENTRIES,
+                    max_bytes=DEFAULT_CACHE_BYTES,
+                )
+            self.generator.response_cache = response_cache
+
+    async def _worker(self, pairs: Dict[str, UnitTestPair], semaphore: asyncio.Semaphore, checker_lock: asyncio.Lock):
+        job_ids = set(pairs.keys())
+        while True:
+            job_id = self.queue.claim(job_ids)
+            if job_id is None:
+                return
+            pair = pairs[job_id]
+            try:
+                result = await self.generator.aiterative_generate_result(
+                    pair, semaphore, checker_lock, self.max_n,
+                    on_state=lambda state, result: self.queue.update(job_id, state, result),
+                )
+            except Exception as e:
+                print(f"Failed to generate a test for {pair.focal_class.name}.{pair.focal_method.name}: ", e)
+                self.queue.release(job_id, f"{type(e).__name__}: {e}", self.max_attempts)
+                continue
+            self.queue.finish(job_id, result)
+
+    async def arun(self, pairs: List[UnitTestPair]) -> Dict[str, int]:
+        """
+        Queue the new pairs and generate tests for the pending ones.
+        returns: number of jobs per state
+        """
+        self.queue.add(pairs)
+        self.queue.reset_interrupted()
+        pairs_by_id = {get_job_id(pair): pair for pair in pairs}
+        semaphore = asyncio.Semaphore(self.num_workers)
+        checker_lock = asyncio.Lock()
+        await asyncio.gather(*[self._worker(pairs_by_id, semaphore, checker_lock) for _ in range(self.num_workers)])
+        self.generator.response_cache.evict()
+        return self.queue.counts()
+
+    def run(self, pairs: List[UnitTestPair]) -> Dict[str, int]:
+        return asyncio.run(self.arun(pairs))
@@ -5,46 +5,58 @@
 
 
 from typing import List, Optional, Tuple
+import os
 import re
 
-FILE_PATTERN = r"(/[a-zA-Z\./:]*[\s]?):\[([0-9]+),([0-9]+)\]"
+from chattester.surefire_parser import TestReport
+
+# `/path/to/Foo.java:[12,5]`, paths may hold any character but whitespace
+FILE_PATTERN = r"(\S+?\.java):\[([0-9]+),([0-9]+)\]"
+JAVAC_PATTERN = re.compile(r"^(.+\.java):([0-9]+): (error|warning): (.*)$")
+JAVAC_SUMMARY_PATTERN = re.compile(r"^[0-9]+ (error|warning)s?$")
+
+LEVEL_PREFIXES = (("[INFO]", "info"), ("[WARNING]", "warning"), ("[ERROR]", "error"))
+FILE_REGEX = re.compile(FILE_PATTERN)
 
 class MavenOutputLine(object):
     def __init__(self, level: str, msg: str) -> None:
         self.level = level
         self.msg = msg
-    
+        self._match = FILE_REGEX.search(msg)
+
     def __str__(self) -> str:
         return f"{self.level}: {self.msg}"
-    
-    def get_path(self) -> Optional[str]:
-        match = re.search(FILE_PATTERN, self.msg)
 
-        if match:
-            return match.group(1)
+    def add_continuation(self, text: str):
+        if self._match is None:
+            self._match = FILE_REGEX.search(text)
+        self.msg += "\n" + text
+
+    def get_path(self) -> Optional[str]:
+        if self._match:
+            return self._match.group(1)
         else:
             return None
     
     def get_line_col(self) -> Optional[Tuple[int, int]]:
-        match = re.search(FILE_PATTERN, self.msg)
-
-        if match:
-            return int(match.group(2)), int(match.group(3))
+        if self._match:
+            return int(self._match.group(2)), int(self._match.group(3))
         else:
             return None
     
     def get_message(self) -> Optional[str]:
-        path = self.get_path()
-        if path is None:
+        if self._match is None:
             return self.msg
         else:
-            return re.sub(FILE_PATTERN, '', self.msg)
+            return FILE_REGEX.sub('', self.msg)
 
 class MavenOutput(object):
-    def __init__(self, output: List[MavenOutputLine] = []) -> None:
-        self.output: List[MavenOutputLine] = output
+    def __init__(self, output: Optional[List[MavenOutputLine]] = None) -> None:
+        self.output: List[MavenOutputLine] = output if output is not None else []
         self.status: Optional[str] = None
         self.text: str = ''
+        # results of the generated test class when its test report was found
+        self.test_report: Optional[TestReport] = None
     
     def __len__(self) -> int:
         return len(self.output)
@@ -61,30 +73,129 @@ class MavenOutput(object):
     def filter(self, level: str) -> "MavenOutput":
         return MavenOutput([line for line in self.output if line.level == level])
 
+class MavenOutputStream(object):
+    """
+    Incremental maven log parser, fed one line at a time while the build runs.
+    With `watch_path` set, `feed` returns True once the compiler errors for
+    the file whose path ends with `watch_path` have been reported (at the end
+    of the error block, or at the first error with `immediate`), so the
+    caller can stop the build instead of waiting for the rest of the reactor.
+    """
+    def __init__(self, watch_path: Optional[str] = None, immediate: bool = False, keep_text: bool = True) -> None:
+        self.watch_path = os.path.normpath(watch_path).replace("\\", "/") if watch_path is not None else None
+        self.immediate = immediate
+        self.keep_text = keep_text
+        self.out = MavenOutput()
+        self.first_error: Optional[MavenOutputLine] = None
+        self.stopped = False
+        self.finished = False
+        self._lines: List[str] = []
+
+    def _is_watched(self, line: MavenOutputLine) -> bool:
+        if self.watch_path is None or line.level != "error":
+            return False
+        path = line.get_path()
+        if path is None:
+            return False
+        path = os.path.normpath(path).replace("\\", "/")
+        return path == self.watch_path or path.endswith("/" + self.watch_path)
+
+    def feed(self, line: str) -> bool:
+        """returns True when the rest of the build output is not needed"""
+        if self.finished:
+            return self.stopped
+        if self.keep_text:
+            self._lines.append(line)
+
+        for prefix, level in LEVEL_PREFIXES:
+            if line.startswith(prefix):
+                if self.first_error is not None and not self.immediate and level != "error":
+                    # end of the compiler error block that reported the watched file
+                    self.stopped = True
+                    self.finished = True
+                    return True
+                new_line = MavenOutputLine(level, line[len(prefix):].strip())
+                self.out.append(new_line)
+                break
+        else:
+            if len(self.out) == 0:
+                self.out.append(MavenOutputLine("info", line.strip()))
+            else:
+                self.out[-1].add_continuation(line.strip())
+            new_line = self.out[-1]
+
+        if self.first_error is None and self._is_watched(new_line):
+            self.first_error = new_line
+            if self.immediate:
+                self.stopped = True
+                self.finished = True
+                return True
+
+        if "BUILD FAILURE" in line:
+            self.out.status = "failure"
+            self.finished = True
+        elif "BUILD SUCCESS" in line:
+            self.out.status = "success"
+            self.finished = True
+        return False
+
+    def finish(self) -> MavenOutput:
+        if self.stopped and self.out.status is None:
+            self.out.status = "failure"
+        self.out.text = "".join(self._lines)
+        return self.out
+
 class MavenOutputParser(object):
     def __init__(self) -> None:
         pass
 
-    def parse(self, output: str):
-        lines = output.splitlines(keepends=True)
+    def stream(self, watch_path: Optional[str] = None, immediate: bool = False) -> MavenOutputStream:
+        return MavenOutputStream(watch_path=watch_path, immediate=immediate)
 
-        out = MavenOutput()
+    def parse(self, output: str) -> MavenOutput:
+        stream = MavenOutputStream(keep_text=False)
+        for line in output.splitlines(keepends=True):
+            stream.feed(line)
+            if stream.finished:
+                break
+        out = stream.finish()
         out.text = output
-        for i, line in enumerate(lines):
-            if line.startswith("[INFO]"):
-                out.append(MavenOutputLine("info", line[6:].strip()))
-            elif line.startswith("[WARNING]"):
-                out.append(MavenOutputLine("warning", line[9:].strip()))
-            elif line.startswith("[ERROR]"):
-                out.append(MavenOutputLine("error", line[7:].strip()))
+        return out
+
+class JavacOutputParser(object):
+    """
+    Parses plain `javac` output into a MavenOutput whose messages use the
+    maven compiler format `path:[line,col] message`.
+    """
+    def __init__(self) -> None:
+        pass
+
+    def parse(self, output: str) -> MavenOutput:
+        out = MavenOutput([])
+        out.text = output
+        out.status = "success"
+
+        current = None
+        quoted_source = False
+        for line in output.splitlines():
+            match = JAVAC_PATTERN.match(line)
+            if match:
+                path, line_num, level, msg = match.groups()
+                current = [level, path, int(line_num), 1, msg]
+                # javac quotes the source line next, then a caret under the column
+                quoted_source = True
+                out.append(current)
+                if level == "error":
+                    out.status = "failure"
+            elif current is None or JAVAC_SUMMARY_PATTERN.match(line.strip()):
+                continue
+            elif quoted_source:
+                quoted_source = False
+            elif line.strip() == "^":
+                current[3] = line.index("^") + 1
             else:
-                out[-1].msg += "\n" + line.strip()
-            
-            if "BUILD FAILURE" in line:
-                out.status = "failure"
-                break
-            elif "BUILD SUCCESS" in line:
-                out.status = "success"
-                break
-        
-        return out
\ No newline at end of file
+                current[4] += "\n" + line.strip()
+
+        for i, (level, path, line_num, col, msg) in enumerate(out.output):
+            out[i] = MavenOutputLine(level, f"{path}:[{line_num},{col}] {msg}")
+        return out
@@ -0,0 +1,123 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import difflib
+from typing import Optional, Tuple
+
+from langchain import PromptTemplate
+from langchain.memory.chat_memory import BaseChatMemory
+
+from chattester.context import FocalContextBuilder
+from chattester.instrumentation import count_tokens
+from chattester.source import UnitTestPair
+
+# context lines around each change of the diff between rounds
+DIFF_CONTEXT_LINES = 1
+
+DIFF_TEMPLATE = """// Changes to the test method of the last query, with the buggy lines marked again
+```diff
+{diff}
+```"""
+
+
+class RepairConversation(object):
+    """
+    Conversation state of the repair rounds of one pair, rebuilt each round:
+    the focal class context stays pinned and the window only holds the last
+    exchange. When the last query sent the test in full, the new test is sent
+    as a diff against it, with its buggy lines marked, if the diff takes fewer
+    tokens than the marked test. Every query fits in `token_cap` by trimming
+    the focal class context, so prompts do not grow with the number of rounds.
+    """
+    def __init__(self,
+            pair: UnitTestPair,
+            prompt: PromptTemplate,
+            context_builder: FocalContextBuilder,
+            token_cap: Optional[int] = None,
+            model_name: Optional[str] = None,
+        ) -> None:
+        """
+        params:
+            prompt: repair prompt with the `test_method`, `test_context` and `class_name` variables
+            token_cap: maximum tokens of a repair query and its window, unlimited if None
+        """
+        self.pair = pair
+        self.prompt = prompt
+        self.context_builder = context_builder
+        self.token_cap = token_cap
+        self.model_name = model_name
+        self.rounds = 0
+        # marked test sent in full by the last query, the base of the next diff
+        self.last_marked_test: Optional[str] = None
+        self.last_query: Optional[str] = None
+        # exchange the current query refers to, None if the test was sent in full
+        self.window: Optional[Tuple[str, str]] = None
+
+    def _get_diff(self, marked_test: str) -> Optional[str]:
+        if self.last_marked_test is None:
+            return None
+        diff = list(difflib.unified_diff(
+            self.last_marked_test.splitlines(), marked_test.splitlines(),
+            "previous", "current", n=DIFF_CONTEXT_LINES, lineterm="",
+        ))
+        if len(diff) == 0:
+            return None
+        return "\n".join(diff)
+
+    def _format(self, test_method: str, focal_context: str) -> str:
+        return self.prompt.format(
+            test_method=test_method,
+            test_context=focal_context,
+            class_name=self.pair.focal_class.name,
+        )
+
+    def _fit(self, test_method: str, window_tokens: int) -> str:
+        focal_context = self.context_builder.build(self.pair)
+        query = self._format(test_method, focal_context)
+        if self.token_cap is None:
+            return query
+        query_tokens = count_tokens(query, self.model_name) + window_tokens
+        if query_tokens <= self.token_cap:
+            return query
+        context_tokens = count_tokens(focal_context, self.model_name)
+        focal_context = self.context_builder.build(self.pair, token_budget=max(context_tokens - (query_tokens - self.token_cap), 0))
+        return self._format(test_method, focal_context)
+
+    def next_query(self, test: str, marked_test: str, answer: Optional[str] = None) -> str:
+        """
+        params:
+            test: the test that failed
+            marked_test: `test` with its buggy lines marked
+            answer: the model answer to the last query `test` was completed from
+        returns: the repair query of this round, to be sent after `load_memory`
+        """
+        self.rounds += 1
+        self.window = None
+        diff = self._get_diff(marked_test)
+        if diff is not None and answer is not None:
+            diff_method = DIFF_TEMPLATE.format(diff=diff)
+            if count_tokens(diff_method, self.model_name) < count_tokens(marked_test, self.model_name):
+                self.window = (self.last_query, answer)
+                window_tokens = 0
+                if self.token_cap is not None:
+                    window_tokens = sum(count_tokens(text, self.model_name) for text in self.window)
+                query = self._fit(diff_method, window_tokens)
+                if self.token_cap is None or window_tokens < self.token_cap:
+                    # the test of this query is only known through the window, the next one is sent in full
+                    self.last_marked_test = None
+                    self.last_query = query
+                    return query
+                self.window = None
+
+        query = self._fit(marked_test, 0)
+        self.last_marked_test = marked_test
+        self.last_query = query
+        return query
+
+    def load_memory(self, memory: BaseChatMemory):
+        """Replace the conversation memory with the window of the last query."""
+        memory.clear()
+        if self.window is not None:
+            memory.save_context({"input": self.window[0]}, {"response": self.window[1]})
@@ -0,0 +1,183 @@
+// Copyright 2023 by XiaHan. All rights reserved.
+// This file is part of the ChatTester,
+// and is released under the "MIT License Agreement". Please see the LICENSE
+// file that should have been included as part of this package.
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.lang.reflect.Method;
+import java.net.URI;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.List;
+import java.util.Locale;
+
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived compiler for generated tests, started by chattester.compile_service.
+ *
+ * Usage: java CompileServer.java CLASSPATH
+ *
+ * Requests are read from stdin with one field per line, responses are written
+ * to stdout with one record per line and tab separated fields. Backslash,
+ * newline, carriage return and tab in fields are escaped as \\, \n, \r and \t.
+ *
+ *   COMPILE, output dir, source path, source text
+ *     -> DIAG kind line column path message ... then END 0|1
+ *   RUN, test class name
+ *     -> FAIL name message trace ... then END 0|1 run count
+ *   PING -> END 1
+ */
+public class CompileServer {
+    private static final String SEP = "\t";
+
+    private final String classpath;
+    private final JavaCompiler compiler;
+    private final StandardJavaFileManager fileManager;
+    private final PrintWriter out;
+
+    static class SourceText extends SimpleJavaFileObject {
+        private final String text;
+
+        SourceText(String path, String text) {
+            super(URI.create("string:///" + path.replace('\\', '/').replaceFirst("^/+", "")), JavaFileObject.Kind.SOURCE);
+            this.text = text;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return text;
+        }
+    }
+
+    CompileServer(String classpath, PrintWriter out) {
+        this.classpath = classpath;
+        this.compiler = ToolProvider.getSystemJavaCompiler();
+        // reused across requests, keeps the classpath index warm
+        this.fileManager = compiler.getStandardFileManager(null, Locale.ROOT, StandardCharsets.UTF_8);
+        this.out = out;
+    }
+
+    static String escape(String s) {
+        if (s == null) {
+            return "";
+        }
+        return s.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t");
+    }
+
+    static String unescape(String s) {
+        StringBuilder sb = new StringBuilder(s.length());
+        for (int i = 0; i < s.length(); i++) {
+            char c = s.charAt(i);
+            if (c == '\\' && i + 1 < s.length()) {
+                char n = s.charAt(++i);
+                if (n == 'n') {
+                    sb.append('\n');
+                } else if (n == 'r') {
+                    sb.append('\r');
+                } else if (n == 't') {
+                    sb.append('\t');
+                } else {
+                    sb.append(n);
+                }
+            } else {
+                sb.append(c);
+            }
+        }
+        return sb.toString();
+    }
+
+    void compile(String outputDir, String path, String text) {
+        new File(outputDir).mkdirs();
+        DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<>();
+        List<String> options = Arrays.asList(
+            "-classpath", classpath, "-d", outputDir, "-nowarn", "-proc:none", "-encoding", "UTF-8");
+        List<JavaFileObject> units = new ArrayList<>();
+        units.add(new SourceText(path, text));
+        boolean success = compiler.getTask(null, fileManager, diagnostics, options, null, units).call();
+        for (Diagnostic<? extends JavaFileObject> d : diagnostics.getDiagnostics()) {
+            String source = d.getSource() == null ? "" : d.getSource().getName();
+            out.println("DIAG" + SEP + d.getKind().name().toLowerCase(Locale.ROOT) + SEP
+                + d.getLineNumber() + SEP + d.getColumnNumber() + SEP
+                + escape(source) + SEP + escape(d.getMessage(Locale.ROOT)));
+        }
+        out.println("END" + SEP + (success ? 1 : 0));
+    }
+
+    void run(String className) throws Exception {
+        String[] entries = classpath.split(File.pathSeparator);
+        List<URL> urls = new ArrayList<>();
+        for (String entry : entries) {
+            if (!entry.isEmpty()) {
+                urls.add(new File(entry).toURI().toURL());
+            }
+        }
+        // a fresh loader per run picks up the newly compiled test class
+        try (URLClassLoader loader = new URLClassLoader(urls.toArray(new URL[0]), ClassLoader.getPlatformClassLoader())) {
+            Class<?> testClass = loader.loadClass(className);
+            Class<?> junitCore = loader.loadClass("org.junit.runner.JUnitCore");
+            Method runClasses = junitCore.getMethod("runClasses", Class[].class);
+            Object result = runClasses.invoke(null, (Object) new Class<?>[] {testClass});
+            Class<?> resultClass = result.getClass();
+            int runCount = (Integer) resultClass.getMethod("getRunCount").invoke(result);
+            boolean success = (Boolean) resultClass.getMethod("wasSuccessful").invoke(result);
+            for (Object failure : (List<?>) resultClass.getMethod("getFailures").invoke(result)) {
+                Class<?> failureClass = failure.getClass();
+                out.println("FAIL" + SEP + escape(String.valueOf(failureClass.getMethod("getTestHeader").invoke(failure)))
+                    + SEP + escape((String) failureClass.getMethod("getMessage").invoke(failure))
+                    + SEP + escape((String) failureClass.getMethod("getTrace").invoke(failure)));
+            }
+            out.println("END" + SEP + (success ? 1 : 0) + SEP + runCount);
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        PrintWriter out = new PrintWriter(new OutputStreamWriter(System.out, StandardCharsets.UTF_8), true);
+        // output of the tests must not mix with responses
+        System.setOut(new PrintStream(System.err, true, "UTF-8"));
+        CompileServer server = new CompileServer(args.length > 0 ? args[0] : "", out);
+        if (server.compiler == null) {
+            System.err.println("No system java compiler, a JDK is required");
+            System.exit(2);
+        }
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String command;
+        while ((command = in.readLine()) != null) {
+            try {
+                if (command.equals("COMPILE")) {
+                    String outputDir = unescape(in.readLine());
+                    String path = unescape(in.readLine());
+                    String text = unescape(in.readLine());
+                    server.compile(outputDir, path, text);
+                } else if (command.equals("RUN")) {
+                    server.run(unescape(in.readLine()));
+                } else if (command.equals("PING")) {
+                    out.println("END" + SEP + 1);
+                } else if (command.equals("EXIT")) {
+                    break;
+                } else {
+                    out.println("ERROR" + SEP + escape("Unknown command: " + command));
+                    out.println("END" + SEP + 0);
+                }
+            } catch (Throwable e) {
+                out.println("ERROR" + SEP + escape(e.toString()));
+                out.println("END" + SEP + 0);
+            }
+        }
+    }
+}
@@ -0,0 +1,124 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import contextlib
+import os
+import queue
+import shutil
+import threading
+from typing import Iterator, List, Optional
+
+from chattester.checker import UnitTestChecker
+from chattester.instrumentation import Instrumentation
+
+# build output shared with the project in focused mode
+SHARED_DIRS = ("target",)
+IGNORED_DIRS = (".git", ".idea", ".svn")
+# compiled generated tests of a sandbox, in each module of the sandbox
+SANDBOX_TEST_OUTPUT_DIR = ".chattester-test-classes"
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class Sandbox(object):
+    """A lightweight copy of a project owned by one worker at a time."""
+    def __init__(self, project_path: str, path: str, mode: str = "maven", instrumentation: Optional[Instrumentation] = None,
+            timeout: Optional[float] = None) -> None:
+        self.project_path = os.path.abspath(project_path)
+        self.path = path
+        self.checker = UnitTestChecker(self.path, mode=mode, test_output_dir=SANDBOX_TEST_OUTPUT_DIR, timeout=timeout,
+            instrumentation=instrumentation)
+
+    def map_path(self, path: str) -> str:
+        """Translate a path in the original project into this sandbox."""
+        rel_path = os.path.relpath(os.path.abspath(path), self.project_path)
+        return os.path.join(self.path, rel_path)
+
+
+class SandboxManager(object):
+    """
+    Pool of per-worker project copies so that generated tests can be written
+    and validated in parallel.
+    Sources are hardlinked (copied where hardlinks are not supported) and the
+    local maven repository is shared as usual. In `focused` and `service` mode the `target`
+    directories are symlinked to the project's build output, each sandbox only
+    compiles its generated tests into its own directory. In `maven` mode every
+    sandbox keeps its own build output, since `mvn clean` would wipe shared
+    ones. Sandboxes are created lazily and reused across pairs.
+    """
+    def __init__(self, project_path: str, root_dir: str, num_sandboxes: int = 1, mode: str = "maven",
+            instrumentation: Optional[Instrumentation] = None, timeout: Optional[float] = None) -> None:
+        """
+        params:
+            timeout: seconds before a validation command of a sandbox is killed, see `UnitTestChecker`
+        """
+        self.project_path = os.path.abspath(project_path)
+        self.root_dir = os.path.abspath(root_dir)
+        self.num_sandboxes = num_sandboxes
+        self.mode = mode
+        self.instrumentation = instrumentation
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._created: List[Sandbox] = []
+        self._idle: "queue.Queue[Sandbox]" = queue.Queue()
+
+    def _ignore(self, src: str, names: List[str]) -> List[str]:
+        return [n for n in names if n in IGNORED_DIRS or n in SHARED_DIRS or n == SANDBOX_TEST_OUTPUT_DIR]
+
+    def _create(self, index: int) -> Sandbox:
+        path = os.path.join(self.root_dir, f"sandbox-{index}")
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        shutil.copytree(self.project_path, path, ignore=self._ignore, copy_function=_link_or_copy, symlinks=True)
+        if self.mode == "maven":
+            return Sandbox(self.project_path, path, mode=self.mode, instrumentation=self.instrumentation, timeout=self.timeout)
+
+        for dir_path, dir_names, file_names in os.walk(self.project_path):
+            dir_names[:] = [n for n in dir_names if n not in IGNORED_DIRS]
+            for name in SHARED_DIRS:
+                if name in dir_names:
+                    dir_names.remove(name)
+                    rel_path = os.path.relpath(os.path.join(dir_path, name), self.project_path)
+                    os.symlink(os.path.join(dir_path, name), os.path.join(path, rel_path))
+        return Sandbox(self.project_path, path, mode=self.mode, instrumentation=self.instrumentation, timeout=self.timeout)
+
+    def acquire(self) -> Sandbox:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            index = len(self._created)
+            if index < self.num_sandboxes:
+                sandbox = self._create(index)
+                self._created.append(sandbox)
+                return sandbox
+        return self._idle.get()
+
+    def release(self, sandbox: Sandbox):
+        self._idle.put(sandbox)
+
+    @contextlib.contextmanager
+    def sandbox(self) -> Iterator[Sandbox]:
+        sandbox = self.acquire()
+        try:
+            yield sandbox
+        finally:
+            self.release(sandbox)
+
+    def cleanup(self):
+        with self._lock:
+            for sandbox in self._created:
+                sandbox.checker.close()
+                shutil.rmtree(sandbox.path, ignore_errors=True)
+            self._created = []
+            self._idle = queue.Queue()
@@ -4,16 +4,86 @@
 # file that should have been included as part of this package.
 
 import javalang
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, Dict, List, Optional, Type, TypeVar
 from chattester import javalang_utils
 
-from chattester.javalang_utils import get_method_start_end, get_method_text
+from chattester.javalang_utils import NodeSpanIndex, TokenSpanIndex
 
 class SourceFile(BaseModel):
     path: str
     type: str
     codetext: str
+    _line_offsets: Optional[List[int]] = PrivateAttr(default=None)
+
+    class Config:
+        # all members of a file share one SourceFile instead of validated copies
+        copy_on_model_validation = "none"
+
+    @property
+    def id(self) -> str:
+        return self.path
+
+    @property
+    def line_offsets(self) -> List[int]:
+        if self._line_offsets is None:
+            offsets = [0]
+            for line in self.codetext.splitlines(keepends=True):
+                offsets.append(offsets[-1] + len(line))
+            self._line_offsets = offsets
+        return self._line_offsets
+
+    def get_lines(self, start_line: int, end_line: int) -> str:
+        """Text of the 1-based, inclusive line range."""
+        offsets = self.line_offsets
+        start_line = max(start_line, 1)
+        end_line = min(end_line, len(offsets) - 1)
+        return self.codetext[offsets[start_line - 1]:offsets[end_line]]
+
+
+class ParsedJavaFile(object):
+    """A java file read, tokenized and parsed once, shared by all extractors."""
+    def __init__(self, path: str, codetext: str, tokens: Optional[List[javalang.tokenizer.JavaToken]] = None) -> None:
+        """
+        params:
+            tokens: tokens of `codetext` when it was already tokenized, ex. by a JavaTokenScan
+        """
+        self.path = path
+        self.codetext = codetext
+        self.codelines = codetext.splitlines(keepends=True)
+        self.tokens = tokens if tokens is not None else list(javalang.tokenizer.tokenize(codetext))
+        self.tree = javalang.parser.Parser(self.tokens).parse()
+        self.source = SourceFile(path=path, type="java", codetext=codetext)
+        self._spans = None
+        self._token_spans = None
+
+    @property
+    def spans(self) -> NodeSpanIndex:
+        if self._spans is None:
+            self._spans = NodeSpanIndex(self.tree)
+        return self._spans
+
+    @property
+    def token_spans(self) -> TokenSpanIndex:
+        if self._token_spans is None:
+            self._token_spans = TokenSpanIndex(self.codetext, self.tokens)
+        return self._token_spans
+
+    def get_node_text(self, node: javalang.ast.Node, has_body: bool = True):
+        """
+        returns: source text, first and last line of a declaration, the line of the node if it cannot be sliced
+        """
+        span = self.token_spans.get(node, has_body)
+        if span is None:
+            line = node.position.line if node.position is not None else 1
+            return self.source.get_lines(line, line), line, line
+        return span
+
+    @staticmethod
+    def from_path(path: str) -> "ParsedJavaFile":
+        with open(path, "r", encoding="utf-8") as f:
+            codetext = f.read()
+        return ParsedJavaFile(path, codetext)
 
 
 class SourcePos(BaseModel):
@@ -50,15 +120,11 @@ class MethodInfo(BaseModel):
         return "".join(decl)
 
     @staticmethod
-    def from_node(source: SourceFile, tree: javalang.ast.Node, node: javalang.ast.Node, lex=None) -> "MethodInfo":
-        codelines = source.codetext.splitlines(keepends=True)
-
-        startpos, endpos, startline, endline = get_method_start_end(tree, node)
-        method_text, startline, endline, lex = get_method_text(codelines, startpos, endpos, startline, endline, lex)
-        
+    def from_node(parsed: ParsedJavaFile, node: javalang.ast.Node) -> "MethodInfo":
+        method_text, startline, endline = parsed.get_node_text(node)
 
         return MethodInfo(
-            source=source,
+            source=parsed.source,
             range=LineRange(start_line=startline, end_line=endline),
             text=method_text,
             name=node.name,
@@ -74,20 +140,15 @@ class FieldInfo(BaseModel):
     name: str
 
     @staticmethod
-    def from_node(source: SourceFile, tree: javalang.ast.Node, node: javalang.ast.Node) -> "FieldInfo":
-        lex = None
-        codelines = source.codetext.splitlines(keepends=True)
-
-        sub_node = node
-        for path, field_node in node.filter(javalang.tree.VariableDeclarator):
-            sub_node = field_node
-        startpos, endpos, startline, endline = get_method_start_end(tree, sub_node)
-        field_text, startline, endline, lex = get_method_text(codelines, startpos, endpos, startline, endline, lex)
-        
+    def from_node(parsed: ParsedJavaFile, node: javalang.ast.Node) -> "FieldInfo":
+        # not the declarators of anonymous classes in the initializer
+        sub_node = node.declarators[-1]
+        field_text, startline, endline = parsed.get_node_text(node, has_body=False)
+
         return FieldInfo(
-            source=source,
-            range=LineRange(start_line=node.position.line, end_line=node.position.line + 1),
-            text=codelines[node.position.line].strip(),
+            source=parsed.source,
+            range=LineRange(start_line=startline, end_line=endline),
+            text=field_text.strip(),
             name=sub_node.name,
         )
 
@@ -100,26 +161,22 @@ class ClassInfo(BaseModel):
     methods: List[MethodInfo]
 
     @staticmethod
-    def from_node(source: SourceFile, tree: javalang.ast.Node, node: javalang.ast.Node) -> "ClassInfo":
-        lex = None
-        codelines = source.codetext.splitlines(keepends=True)
+    def from_node(parsed: ParsedJavaFile, node: javalang.ast.Node) -> "ClassInfo":
+        class_text, startline, endline = parsed.get_node_text(node)
 
-        startpos, endpos, startline, endline = get_method_start_end(tree, node)
-        class_text, startline, endline, lex = get_method_text(codelines, startpos, endpos, startline, endline, lex)
-        
         fields = []
         for path, field_node in node.filter(javalang.tree.FieldDeclaration):
-            fields.append(FieldInfo.from_node(source, tree, field_node))
+            fields.append(FieldInfo.from_node(parsed, field_node))
 
         methods = []
         for path, method_node in node.filter(javalang.tree.MethodDeclaration):
-            methods.append(MethodInfo.from_node(source, tree, method_node))
+            methods.append(MethodInfo.from_node(parsed, method_node))
 
         for path, method_node in node.filter(javalang.tree.ConstructorDeclaration):
-            methods.append(MethodInfo.from_node(source, tree, method_node))
+            methods.append(MethodInfo.from_node(parsed, method_node))
         
         return ClassInfo(
-            source=source,
+            source=parsed.source,
             range=LineRange(start_line=startline, end_line=endline),
             text=class_text,
             name=node.name,
@@ -128,10 +185,67 @@ class ClassInfo(BaseModel):
         )
 
 
+class FocalFileInfo(BaseModel):
+    package_info: Optional[str]
+    imports: List[str]
+    focal_class: Optional[ClassInfo]
+    methods: List[MethodInfo]
+
+class TestFileInfo(BaseModel):
+    package_info: Optional[str]
+    imports: List[str]
+    test_methods: List[MethodInfo]
+
 
 class UnitTestPair(BaseModel):
     focal_class: ClassInfo
     focal_method: MethodInfo
     test_path: str
     package_info: str
-    imports: List[str]
\ No newline at end of file
+    imports: List[str]
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+def _compact_value(value: Any, sources: Dict[str, dict]) -> Any:
+    if isinstance(value, SourceFile):
+        if value.id not in sources:
+            sources[value.id] = value.dict()
+        return value.id
+    elif isinstance(value, BaseModel):
+        return {name: _compact_value(getattr(value, name), sources) for name in value.__fields__}
+    elif isinstance(value, list):
+        return [_compact_value(v, sources) for v in value]
+    else:
+        return value
+
+def _expand_value(value: Any, sources: Dict[str, SourceFile]) -> Any:
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k == "source" and isinstance(v, str):
+                out[k] = sources[v]
+            else:
+                out[k] = _expand_value(v, sources)
+        return out
+    elif isinstance(value, list):
+        return [_expand_value(v, sources) for v in value]
+    else:
+        return value
+
+def to_compact(value: Any) -> dict:
+    """
+    JSON-ready form of a model or a list of models, with each SourceFile stored
+    once in a `sources` table and members referring to it by id.
+    `value.dict()` still gives the full nested shape.
+    """
+    sources = {}
+    data = _compact_value(value, sources)
+    return {"sources": sources, "data": data}
+
+def from_compact(compact: dict, model_type: Type[ModelT]) -> Any:
+    sources = {k: SourceFile.parse_obj(v) for k, v in compact["sources"].items()}
+    data = _expand_value(compact["data"], sources)
+    if isinstance(data, list):
+        return [model_type.parse_obj(d) for d in data]
+    else:
+        return model_type.parse_obj(data)
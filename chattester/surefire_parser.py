@@ -0,0 +1,173 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+REPORT_DIRS = ("target/surefire-reports", "target/failsafe-reports")
+FRAME_PATTERN = re.compile(r"^\s*at\s+([\w$.<>/]+)\.([\w$<>]+)\(([^:)]*)(?::([0-9]+))?\)")
+# stack frames kept per test case
+MAX_FRAMES = 10
+
+
+class StackFrame(BaseModel):
+    class_name: str
+    method_name: str
+    file_name: Optional[str] = None
+    line: Optional[int] = None
+
+
+class TestCaseResult(BaseModel):
+    name: str
+    class_name: str
+    # `passed`, `failure` (assertion), `error` (exception) or `skipped`
+    status: str
+    time: float = 0.0
+    message: Optional[str] = None
+    type: Optional[str] = None
+    frames: List[StackFrame] = []
+    # line of the test class the test failed at, from the stack trace
+    line: Optional[int] = None
+
+
+class TestReport(BaseModel):
+    name: str
+    tests: int = 0
+    failures: int = 0
+    errors: int = 0
+    skipped: int = 0
+    time: float = 0.0
+    test_cases: List[TestCaseResult] = []
+
+    @property
+    def success(self) -> bool:
+        return all(case.status in ("passed", "skipped") for case in self.test_cases)
+
+    def failed(self) -> List[TestCaseResult]:
+        return [case for case in self.test_cases if case.status in ("failure", "error")]
+
+
+def _parse_float(value: Optional[str]) -> float:
+    if value is None:
+        return 0.0
+    try:
+        # surefire formats durations with grouping separators on some locales
+        return float(value.replace(",", ""))
+    except ValueError:
+        return 0.0
+
+def _parse_int(value: Optional[str]) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def parse_stack_trace(trace: str) -> List[StackFrame]:
+    frames = []
+    for line in trace.splitlines():
+        match = FRAME_PATTERN.match(line)
+        if match is None:
+            continue
+        class_name, method_name, file_name, line_num = match.groups()
+        frames.append(StackFrame(
+            class_name=class_name,
+            method_name=method_name,
+            file_name=file_name or None,
+            line=int(line_num) if line_num is not None else None,
+        ))
+    return frames
+
+
+def get_failure_line(frames: List[StackFrame], class_name: str) -> Optional[int]:
+    """Line of the innermost frame in the test class `class_name`."""
+    for frame in frames:
+        if frame.class_name == class_name and frame.line is not None:
+            return frame.line
+    return None
+
+
+class SurefireReportParser(object):
+    """
+    Reads the XML reports written by the maven surefire and failsafe plugins,
+    `TEST-<class name>.xml` in `target/surefire-reports` and
+    `target/failsafe-reports` of each module.
+    """
+    def __init__(self) -> None:
+        pass
+
+    def get_report_paths(self, module_path: str, class_name: str) -> List[str]:
+        paths = []
+        for report_dir in REPORT_DIRS:
+            path = os.path.join(module_path, report_dir, f"TEST-{class_name}.xml")
+            if os.path.exists(path):
+                paths.append(path)
+        return paths
+
+    def _parse_test_case(self, node: ET.Element, test_class_name: str) -> TestCaseResult:
+        case = TestCaseResult(
+            name=node.get("name", ""),
+            class_name=node.get("classname", test_class_name),
+            status="passed",
+            time=_parse_float(node.get("time")),
+        )
+        for status in ("failure", "error", "skipped"):
+            child = node.find(status)
+            if child is None:
+                continue
+            case.status = status
+            case.message = child.get("message")
+            case.type = child.get("type")
+            frames = parse_stack_trace(child.text or "")
+            case.line = get_failure_line(frames, case.class_name)
+            case.frames = frames[:MAX_FRAMES]
+            break
+        return case
+
+    def parse(self, report_text: str) -> Optional[TestReport]:
+        try:
+            root = ET.fromstring(report_text)
+        except ET.ParseError as e:
+            print("Failed to parse test report: ", e)
+            return None
+        suites = [root] if root.tag == "testsuite" else root.findall("testsuite")
+        if len(suites) == 0:
+            return None
+
+        report = TestReport(name=suites[0].get("name", ""))
+        for suite in suites:
+            report.tests += _parse_int(suite.get("tests"))
+            report.failures += _parse_int(suite.get("failures"))
+            report.errors += _parse_int(suite.get("errors"))
+            report.skipped += _parse_int(suite.get("skipped"))
+            report.time += _parse_float(suite.get("time"))
+            for node in suite.iter("testcase"):
+                report.test_cases.append(self._parse_test_case(node, report.name))
+        return report
+
+    def load(self, module_path: str, class_name: str) -> Optional[TestReport]:
+        """
+        Merge the surefire and failsafe reports of the test class `class_name` in `module_path`.
+        returns: the report, None if the test class did not run
+        """
+        out = None
+        for path in self.get_report_paths(module_path, class_name):
+            with open(path, "r", encoding="utf-8") as f:
+                report = self.parse(f.read())
+            if report is None:
+                continue
+            if out is None:
+                out = report
+                continue
+            out.tests += report.tests
+            out.failures += report.failures
+            out.errors += report.errors
+            out.skipped += report.skipped
+            out.time += report.time
+            out.test_cases.extend(report.test_cases)
+        return out
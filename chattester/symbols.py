@@ -0,0 +1,91 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+from typing import Dict, List, Optional, Tuple
+
+from chattester.source import FocalFileInfo, MethodInfo
+
+
+def get_package_name(package_info: Optional[str]) -> str:
+    """`package com.example;` -> `com.example`"""
+    if package_info is None:
+        return ""
+    return package_info.replace("package", "", 1).strip().rstrip(";").strip()
+
+def get_import_name(import_text: str) -> str:
+    """`import static com.example.Foo.bar;` -> `com.example.Foo.bar`"""
+    name = import_text.strip().rstrip(";").strip()
+    name = name.replace("import", "", 1).strip()
+    if name.startswith("static "):
+        name = name[len("static "):].strip()
+    return name
+
+def qualify(package_name: str, class_name: str) -> str:
+    if package_name == "":
+        return class_name
+    return package_name + "." + class_name
+
+def get_focal_class_candidates(test_class_name: str) -> List[str]:
+    """Class names a test class is conventionally named after, most likely first."""
+    out = []
+    for suffix in ("Test", "Tests", "TestCase", "IT"):
+        if test_class_name.endswith(suffix) and len(test_class_name) > len(suffix):
+            out.append(test_class_name[:-len(suffix)])
+    if test_class_name.startswith("Test") and len(test_class_name) > len("Test"):
+        out.append(test_class_name[len("Test"):])
+    return list(dict.fromkeys(out))
+
+
+class ProjectSymbolIndex(object):
+    """
+    Focal classes of a whole project by package-qualified name, with their
+    methods (overloads in declaration order) by lowercase method name.
+    """
+    def __init__(self) -> None:
+        self.classes: Dict[str, FocalFileInfo] = {}
+        self.simple_names: Dict[str, List[str]] = {}
+        self.methods: Dict[Tuple[str, str], List[MethodInfo]] = {}
+
+    def __len__(self) -> int:
+        return len(self.classes)
+
+    def add(self, info: FocalFileInfo):
+        if info.focal_class is None:
+            return
+        qualified_name = qualify(get_package_name(info.package_info), info.focal_class.name)
+        if qualified_name in self.classes:
+            return
+        self.classes[qualified_name] = info
+        self.simple_names.setdefault(info.focal_class.name, []).append(qualified_name)
+        for method in info.methods:
+            self.methods.setdefault((qualified_name, method.name.lower()), []).append(method)
+
+    def resolve_class(self, class_name: str, package_name: str = "", imports: List[str] = []) -> Optional[str]:
+        """
+        Resolve a simple class name seen from `package_name` with `imports`:
+        same package, single-type imports, on-demand imports, then a class
+        name that is unique in the whole project.
+        """
+        qualified_name = qualify(package_name, class_name)
+        if qualified_name in self.classes:
+            return qualified_name
+
+        import_names = [get_import_name(i) for i in imports]
+        for import_name in import_names:
+            if import_name.endswith("." + class_name) and import_name in self.classes:
+                return import_name
+        for import_name in import_names:
+            if import_name.endswith(".*"):
+                qualified_name = qualify(import_name[:-2], class_name)
+                if qualified_name in self.classes:
+                    return qualified_name
+
+        candidates = self.simple_names.get(class_name, [])
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
+
+    def find_methods(self, qualified_name: str, method_name: str) -> List[MethodInfo]:
+        return self.methods.get((qualified_name, method_name.lower()), [])
@@ -3,9 +3,14 @@
 # and is released under the "MIT License Agreement". Please see the LICENSE
 # file that should have been included as part of this package.
 
+import asyncio
+import contextlib
+import contextvars
 import json
 import os
-from typing import List, Optional, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Tuple
 from langchain.memory import ConversationBufferMemory
 from langchain import OpenAI, LLMChain, PromptTemplate
 from langchain.chat_models import ChatOpenAI
@@ -26,11 +31,20 @@ from langchain.schema import (
 )
 
 from langchain.chains import ConversationChain
+from langchain.chat_models.base import BaseChatModel
 from langchain.memory import ConversationBufferMemory
+from pydantic import BaseModel
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
 
+from chattester.cache import ResponseCache
 from chattester.source import UnitTestPair
-from chattester.checker import UnitTestChecker
+from chattester.checker import GENERATED_TEST_SUFFIX, UnitTestChecker
+from chattester.sandbox import Sandbox, SandboxManager
 from chattester.maven_parser import MavenOutputParser
+from chattester.javalang_utils import get_syntax_errors
+from chattester.instrumentation import Instrumentation, Span, count_tokens
+from chattester.context import FocalContextBuilder
+from chattester.repair import RepairConversation
 
 def parse_java_code_from_answer(answer: str) -> Optional[str]:
     idx = answer.find("```java")
@@ -41,6 +55,11 @@ def parse_java_code_from_answer(answer: str) -> Optional[str]:
         java_code = answer[idx + 7: end_idx]
         return java_code
 
+def is_rate_limit_error(e: BaseException) -> bool:
+    if type(e).__name__ == "RateLimitError":
+        return True
+    return getattr(e, "http_status", None) == 429 or getattr(e, "status_code", None) == 429
+
 
 JUNIT_IMPORT = """
 import static org.junit.Assert.fail;
@@ -67,22 +86,77 @@ import java.util.concurrent.atomic.AtomicReference;
 import org.junit.Test;
 """
 
+class GenerationResult(BaseModel):
+    test: str = ""
+    # `passed` or `failed`, empty while generating
+    outcome: str = ""
+    repair_rounds: int = 0
+    # queries and answers, in order
+    transcript: List[Tuple[str, str]] = []
+
+# called with `generating` before model calls and `validating` before checks, and the result so far
+StateCallback = Callable[[str, GenerationResult], None]
+
+
 class ChatGPTUnitTestGenerator(object):
-    def __init__(self, project_path: str, openai_api_key: str, openai_api_base: Optional[str] = None) -> None:
+    def __init__(self,
+            project_path: str,
+            openai_api_key: Optional[str] = None,
+            openai_api_base: Optional[str] = None,
+            model: Optional[BaseChatModel] = None,
+            max_retries: int = 6,
+            response_cache: Optional[ResponseCache] = None,
+            validation_mode: str = "maven",
+            sandbox_manager: Optional[SandboxManager] = None,
+            instrumentation: Optional[Instrumentation] = None,
+            context_builder: Optional[FocalContextBuilder] = None,
+            repair_token_cap: Optional[int] = None,
+            num_candidates: int = 1,
+            max_parallel_checks: int = 4,
+            parse_syntax_check: bool = False,
+            validation_timeout: Optional[float] = None,
+        ) -> None:
+        """
+        params:
+            num_candidates: answers sampled per generation and repair query, validated until one passes
+            max_parallel_checks: candidates validated at the same time, each in its own sandbox
+            parse_syntax_check: reject tests javalang cannot parse without building them, javalang only knows Java 8
+                so tests using newer syntax are rejected too, by default only lexer and bracket errors are
+            validation_timeout: seconds before a build or test run of a generated test is killed, compile service
+                requests default to a finite timeout, pass the same timeout to the `SandboxManager`
+        """
         self.project_path = project_path
         self.model_name = "gpt-3.5-turbo"
         self.openai_api_key = openai_api_key
         self.openai_api_base = openai_api_base
+        self.max_retries = max_retries
+        self.response_cache = response_cache
+        self.validation_mode = validation_mode
+        self.sandbox_manager = sandbox_manager
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.context_builder = context_builder if context_builder is not None else FocalContextBuilder()
+        self.repair_token_cap = repair_token_cap
+        self.num_candidates = num_candidates
+        self.max_parallel_checks = max_parallel_checks
+        self.parse_syntax_check = parse_syntax_check
+        self.validation_timeout = validation_timeout
 
         self.mvn_parser = MavenOutputParser()
-
-        self.model = ChatOpenAI(
-            model_name=self.model_name, 
-            temperature=0.9, 
-            max_tokens=2048,
-            openai_api_key=self.openai_api_key,
-            openai_api_base=self.openai_api_base,
-        )
+        # shared across pairs so that compile services stay warm
+        self.checker = UnitTestChecker(self.project_path, mode=self.validation_mode, timeout=self.validation_timeout,
+            instrumentation=self.instrumentation)
+        # the classpath is built before any generated test is in the tree
+        self.checker.prepare()
+
+        if model is None:
+            model = ChatOpenAI(
+                model_name=self.model_name, 
+                temperature=0.9, 
+                max_tokens=2048,
+                openai_api_key=self.openai_api_key,
+                openai_api_base=self.openai_api_base,
+            )
+        self.model = model
         self.memory = ConversationBufferMemory()
         self.llm_chain = ConversationChain(
             llm=self.model,
@@ -134,26 +208,7 @@ The test method has a bug error(marked <Buggy Line>).
 Please repair the buggy line and return the complete test method after repair.""")
 
     def _get_focal_part(self, pair: UnitTestPair):
-        fields = []
-        for field in pair.focal_class.fields:
-            fields.append(field.text)
-        fields_str = "\n".join(fields)
-        methods = []
-        for method in pair.focal_class.methods:
-            if method.name == pair.focal_method.name:
-                continue
-            methods.append(" ".join(method.modifiers) + " " + method.declaration + ";")
-        methods_str = "\n".join(methods)
-        template = f"""
-// Focal Class
-public class {pair.focal_class.name} {{
-    {fields_str}
-    {methods_str}
-    // Focal method
-    {pair.focal_method.text}
-}}
-"""
-        return template
+        return self.context_builder.build(pair)
     
     def _mark_buggy_line(self, unittest: str, marks: List[Tuple[int, str]]):
         marked_unittest = unittest.splitlines(keepends=False)
@@ -176,21 +231,17 @@ public class {pair.focal_class.name} {{
         return "\n".join([l[1] for l in marked_unittest_with_line])
 
 
-    def basic_generate(self, pair: UnitTestPair):
-        self.memory.clear()
-        focal_str = self._get_focal_part(pair)
-        query = self.basic_prompt.format(
+    def _get_basic_query(self, pair: UnitTestPair) -> str:
+        with self.instrumentation.span("build_prompt", kind="basic"):
+            focal_str = self._get_focal_part(pair)
+        return self.basic_prompt.format(
             focal=focal_str,
             role_instruction=self.role,
             focal_method_name=pair.focal_method.declaration,
             junit_version="Junit4",
         )
-        # with open("out.txt", "w", encoding="utf-8") as f:
-        #     f.write(query)
-        answer = self.llm_chain.run(query)
-        # with open("answer.txt", "w", encoding="utf-8") as f:
-        #     f.write(answer)
 
+    def _complete_basic_answer(self, pair: UnitTestPair, answer: str) -> str:
         focal_imports = [i for i in pair.imports if "java" not in i]
         focal_imports = "\n".join(focal_imports)
 
@@ -199,6 +250,18 @@ public class {pair.focal_class.name} {{
 {focal_imports}
 {parse_java_code_from_answer(answer)}
 """
+
+    def basic_generate(self, pair: UnitTestPair):
+        with self._generate_span(pair, "basic") as span:
+            self.memory.clear()
+            query = self._get_basic_query(pair)
+            # with open("out.txt", "w", encoding="utf-8") as f:
+            #     f.write(query)
+            answer = self._run(self.llm_chain, query)
+            # with open("answer.txt", "w", encoding="utf-8") as f:
+            #     f.write(answer)
+            span.set(outcome="unchecked")
+            return self._complete_basic_answer(pair, answer)
     
     def _complete_unittest(self, test: str, core_class_name: str, package_info: str, focal_imports: str) -> str:
         if "public class" in test:
@@ -206,100 +269,506 @@ public class {pair.focal_class.name} {{
         else:
             return f"{package_info}\n{focal_imports}\npublic class {core_class_name} {{\n{test}\n}}"
 
-    def iterative_generate(self, pair: UnitTestPair, max_n: int=2):
-        chat_history = []
-        checker = UnitTestChecker(self.project_path)
+    def _get_model_name(self) -> str:
+        return getattr(self.model, "model_name", type(self.model).__name__)
 
-        self.memory.clear()
+    def _get_cache_key(self, prompt: str, num_candidates: int = 1) -> str:
+        return ResponseCache.make_key(
+            self._get_model_name(),
+            getattr(self.model, "temperature", None),
+            prompt,
+            num_candidates,
+        )
 
-        # intention query
-        focal_str = self._get_focal_part(pair)
-        intention_query = self.intention_prompt.format(
+    def _generate_span(self, pair: UnitTestPair, kind: str):
+        return self.instrumentation.span(
+            "generate",
+            project=self.project_path,
+            kind=kind,
+            focal_class=pair.focal_class.name,
+            focal_method=pair.focal_method.name,
+            test_path=pair.test_path,
+        )
+
+    def _get_prompt(self, chain: ConversationChain, query: str) -> Optional[str]:
+        """The whole conversation sent for `query`, only needed with a response cache or instrumentation."""
+        if self.response_cache is None and not self.instrumentation.enabled:
+            return None
+        return chain.prompt.format(**chain.prep_inputs(query))
+
+    def _record_llm_call(self, span: Span, prompt: Optional[str], answer: str, cached: bool):
+        if not self.instrumentation.enabled:
+            return
+        model_name = self._get_model_name()
+        span.set(
+            model=model_name,
+            cached=cached,
+            prompt_tokens=count_tokens(prompt, model_name),
+            completion_tokens=count_tokens(answer, model_name),
+        )
+
+    def _run(self, chain: ConversationChain, query: str) -> str:
+        with self.instrumentation.span("llm") as span:
+            prompt = self._get_prompt(chain, query)
+            if self.response_cache is None:
+                answer = chain.run(query)
+                self._record_llm_call(span, prompt, answer, cached=False)
+                return answer
+
+            key = self._get_cache_key(prompt)
+            answer = self.response_cache.lookup(key)
+            cached = answer is not None
+            if answer is None:
+                answer = chain.run(query)
+                self.response_cache.store(key, answer)
+            else:
+                chain.prep_outputs(chain.prep_inputs(query), {chain.output_key: answer})
+            self._record_llm_call(span, prompt, answer, cached=cached)
+            return answer
+
+    def _lookup_candidates(self, prompt: str, num_candidates: int) -> Optional[List[str]]:
+        if self.response_cache is None:
+            return None
+        answers = self.response_cache.lookup(self._get_cache_key(prompt, num_candidates))
+        return json.loads(answers) if answers is not None else None
+
+    def _store_candidates(self, prompt: str, num_candidates: int, answers: List[str]):
+        if self.response_cache is not None:
+            self.response_cache.store(self._get_cache_key(prompt, num_candidates), json.dumps(answers))
+
+    def _sample(self, chain: ConversationChain, query: str, num_candidates: int) -> List[str]:
+        """
+        Sample `num_candidates` answers to `query` in one model call, the first
+        one is kept in the conversation memory. Models without an `n` parameter
+        return a single answer.
+        """
+        if num_candidates == 1:
+            return [self._run(chain, query)]
+        with self.instrumentation.span("llm", candidates=num_candidates) as span:
+            inputs = chain.prep_inputs(query)
+            prompt = chain.prompt.format(**inputs)
+            answers = self._lookup_candidates(prompt, num_candidates)
+            cached = answers is not None
+            if answers is None:
+                result = self.model.generate_prompt([chain.prompt.format_prompt(**inputs)], n=num_candidates)
+                answers = [generation.text for generation in result.generations[0]]
+                self._store_candidates(prompt, num_candidates, answers)
+            chain.prep_outputs(inputs, {chain.output_key: answers[0]})
+            self._record_llm_call(span, prompt, "".join(answers), cached=cached)
+            return answers
+
+    def _new_chain(self) -> ConversationChain:
+        return ConversationChain(
+            llm=self.model,
+            memory=ConversationBufferMemory()
+        )
+
+    def _get_intention_query(self, pair: UnitTestPair) -> str:
+        with self.instrumentation.span("build_prompt", kind="intention"):
+            focal_str = self._get_focal_part(pair)
+        return self.intention_prompt.format(
             focal=focal_str,
             focal_method_name=pair.focal_method.declaration,
         )
-        intention_answer = self.llm_chain.run(intention_query)
 
-        chat_history.append((intention_query, intention_answer))
-
-        # generation query
-        generation_query = self.generation_prompt.format(
+    def _get_generation_query(self, pair: UnitTestPair, intention_answer: str) -> str:
+        return self.generation_prompt.format(
             intention=intention_answer,
             role_instruction=self.role,
             focal_method_name=pair.focal_method.declaration,
             junit_version="Junit4",
         )
 
-        generation_answer = self.llm_chain.run(generation_query)
-        chat_history.append((generation_query, generation_answer))
-
+    def _complete_answer(self, pair: UnitTestPair, answer: str) -> str:
         focal_imports = [i for i in pair.imports if "java" not in i]
         focal_imports = "\n".join(focal_imports)
 
         file_path = os.path.normpath(pair.test_path).replace("\\", "/")
         core_class_name = file_path.split("/")[-1].replace(".java", "")
 
-        unittest = self._complete_unittest(
-            parse_java_code_from_answer(generation_answer),
+        return self._complete_unittest(
+            parse_java_code_from_answer(answer),
             core_class_name,
             pair.package_info,
             focal_imports,
         )
 
-        new_test_file_path = pair.test_path.replace(".java", "Generation.java")
+    def _get_generation_test_path(self, pair: UnitTestPair) -> str:
+        return pair.test_path.replace(".java", GENERATED_TEST_SUFFIX)
 
-        gen_test = unittest
-        for i in range(max_n):
-            gen_test = gen_test.replace(
-                    checker.get_core_class_name(pair.test_path),
-                    checker.get_core_class_name(new_test_file_path)
-            )
-            checker.create_test(new_test_file_path, gen_test)
-            output, success = checker.run_tests()
-            # checker.remove_test(new_test_file_path)
-
-            parsed_output = self.mvn_parser.parse(output)
-            if parsed_output.status == "success":
-                break
-            error_output = parsed_output.filter("error")
-
-            marks = []
-            for each_error in error_output:
-                error_file = each_error.get_path()
-                if error_file is None:
-                    continue
-                
-                if not error_file.endswith("Generation.java"):
-                    continue
+    def _rename_test_class(self, checker: UnitTestChecker, pair: UnitTestPair, gen_test: str) -> str:
+        return gen_test.replace(
+                checker.get_core_class_name(pair.test_path),
+                checker.get_core_class_name(self._get_generation_test_path(pair))
+        )
 
-                line, col = each_error.get_line_col()
-                buggy_msg = each_error.get_message().replace('\n', '\n// ')
-                marks.append((line, f"// <Buggy Line>: {buggy_msg}"))
+    def _check_syntax(self, gen_test: str) -> Optional[str]:
+        """Check a generated test without building it, returns the test with its syntax errors marked or None if none is found."""
+        with self.instrumentation.span("syntax_check") as span:
+            errors = get_syntax_errors(gen_test, parse=self.parse_syntax_check)
+            span.set(errors=len(errors))
+        if len(errors) == 0:
+            return None
+        marks = [(line, f"// <Buggy Line>: {msg}") for line, msg in errors]
+        return self._mark_buggy_line(gen_test, marks)
+
+    def _check_test(self, checker: UnitTestChecker, pair: UnitTestPair, gen_test: str, sandbox: Optional[Sandbox] = None,
+            syntax_checked: bool = False, cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        """Validate a generated test, returns the test with its buggy lines marked or None if the test passes."""
+        with self.instrumentation.span("validate") as span:
+            marked_test = self._validate_test(checker, pair, gen_test, sandbox, syntax_checked, cancel_event)
+            span.set(passed=marked_test is None)
+        return marked_test
+
+    def _validate_test(self, checker: UnitTestChecker, pair: UnitTestPair, gen_test: str, sandbox: Optional[Sandbox],
+            syntax_checked: bool, cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        # malformed answers do not need a build to be rejected
+        if not syntax_checked:
+            marked_test = self._check_syntax(gen_test)
+            if marked_test is not None:
+                return marked_test
+
+        new_test_file_path = self._get_generation_test_path(pair)
+        if sandbox is not None:
+            checker = sandbox.checker
+            new_test_file_path = sandbox.map_path(new_test_file_path)
+        checker.create_test(new_test_file_path, gen_test)
+        parsed_output = checker.check(new_test_file_path, cancel_event)
+        # checker.remove_test(new_test_file_path)
+
+        if parsed_output.status == "success":
+            return None
+        error_output = parsed_output.filter("error")
+
+        marks = []
+        for each_error in error_output:
+            error_file = each_error.get_path()
+            if error_file is None:
+                continue
             
-            buggy_marked_test = self._mark_buggy_line(gen_test, marks)
-
-            self.memory.clear()
-            # buggy query
-            buggy_query = self.bug_prompt.format(
-                test_method=buggy_marked_test,
-            )
+            if not error_file.endswith(GENERATED_TEST_SUFFIX):
+                continue
 
-            buggy_answer = self.llm_chain.run(buggy_query)
-            chat_history.append((buggy_query, buggy_answer))
+            line, col = each_error.get_line_col()
+            buggy_msg = each_error.get_message().replace('\n', '\n// ')
+            marks.append((line, f"// <Buggy Line>: {buggy_msg}"))
 
-            gen_test = self._complete_unittest(
-                parse_java_code_from_answer(buggy_answer),
-                core_class_name,
-                pair.package_info,
-                focal_imports,
-            )
+        if parsed_output.test_report is not None:
+            # failing test methods, at the line of the test class in their stack trace
+            for case in parsed_output.test_report.failed():
+                if case.line is None:
+                    continue
+                buggy_msg = f"{case.type}: {case.message}" if case.message else f"{case.type}"
+                buggy_msg = buggy_msg.replace('\n', '\n// ')
+                marks.append((case.line, f"// <Buggy Line>: {buggy_msg}"))
+
+        return self._mark_buggy_line(gen_test, marks)
+
+    def _new_repair_conversation(self, pair: UnitTestPair) -> RepairConversation:
+        return RepairConversation(
+            pair,
+            self.bug_prompt_with_context,
+            self.context_builder,
+            token_cap=self.repair_token_cap,
+            model_name=self._get_model_name(),
+        )
 
+    def _check_test_in_sandbox(self, checker: UnitTestChecker, pair: UnitTestPair, gen_test: str,
+            cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        with self.sandbox_manager.sandbox() as sandbox:
+            if cancel_event is not None and cancel_event.is_set():
+                # another candidate passed while this one waited for a sandbox
+                return gen_test
+            return self._check_test(checker, pair, gen_test, sandbox, syntax_checked=True, cancel_event=cancel_event)
+
+    def _check_candidates(self, checker: UnitTestChecker, pair: UnitTestPair, gen_tests: List[str],
+            sandbox: Optional[Sandbox] = None) -> Tuple[Optional[int], List[Optional[str]]]:
+        """
+        Validate the candidate tests of a pair until one passes. With a sandbox
+        manager the candidates are validated in parallel and the validations
+        still running are cancelled once one passes.
+        returns: index of the passing candidate (None if all failed), failing candidates with their buggy lines marked
+        """
+        if len(gen_tests) == 1:
+            marked_test = self._check_test(checker, pair, gen_tests[0], sandbox)
+            return (0, [None]) if marked_test is None else (None, [marked_test])
+
+        with self.instrumentation.span("validate_candidates", candidates=len(gen_tests)) as span:
+            marked_tests: List[Optional[str]] = [self._check_syntax(gen_test) for gen_test in gen_tests]
+            indices = [i for i, marked_test in enumerate(marked_tests) if marked_test is None]
+            passed = None
+            if len(indices) == 0:
+                pass
+            elif self.sandbox_manager is None:
+                # candidates share the generated test path of the project tree
+                for i in indices:
+                    marked_tests[i] = self._check_test(checker, pair, gen_tests[i], sandbox, syntax_checked=True)
+                    if marked_tests[i] is None:
+                        passed = i
+                        break
+            else:
+                cancel_event = threading.Event()
+                with ThreadPoolExecutor(max_workers=min(len(indices), self.max_parallel_checks)) as executor:
+                    futures = {
+                        # a context per thread, keeping the current span as their parent
+                        executor.submit(contextvars.copy_context().run, self._check_test_in_sandbox, checker, pair, gen_tests[i], cancel_event): i
+                        for i in indices
+                    }
+                    for future in as_completed(futures):
+                        if future.cancelled():
+                            continue
+                        i = futures[future]
+                        marked_tests[i] = future.result()
+                        if marked_tests[i] is None and passed is None:
+                            passed = i
+                            cancel_event.set()
+                            for other in futures:
+                                other.cancel()
+            span.set(passed=passed)
+        return passed, marked_tests
+
+    def _select_candidate(self, marked_tests: List[Optional[str]]) -> int:
+        """The failing candidate with the fewest buggy lines is repaired."""
+        counts = [marked_test.count("<Buggy Line>") for marked_test in marked_tests]
+        return counts.index(min(counts))
+
+    def _complete_answers(self, pair: UnitTestPair, answers: List[str]) -> List[str]:
+        return [self._complete_answer(pair, answer) for answer in answers]
+
+    def _write_chat_history(self, chat_history: List[Tuple[str, str]]):
         with open("out.txt", "w", encoding="utf-8") as f:
             for line in chat_history:
                 f.write(line[0] + "\n")
                 f.write("--------------\n")
                 f.write(line[1] + "\n")
                 f.write("==============\n")
-        return gen_test
 
+    def iterative_generate(self, pair: UnitTestPair, max_n: int=2):
+        with self._generate_span(pair, "iterative") as span:
+            result = self._iterative_generate(pair, max_n, span)
+        self._write_chat_history(result.transcript)
+        return result.test
+
+    def _iterative_generate(self, pair: UnitTestPair, max_n: int, span: Span) -> GenerationResult:
+        result = GenerationResult()
+        chat_history = result.transcript
+        checker = self.checker
+        outcome = "failed"
+        repair_rounds = 0
+
+        self.memory.clear()
+
+        # intention query
+        intention_query = self._get_intention_query(pair)
+        intention_answer = self._run(self.llm_chain, intention_query)
+        chat_history.append((intention_query, intention_answer))
+
+        # generation query
+        generation_query = self._get_generation_query(pair, intention_answer)
+        generation_answers = self._sample(self.llm_chain, generation_query, self.num_candidates)
+        chat_history.append((generation_query, "\n\n".join(generation_answers)))
+
+        answers = generation_answers
+        gen_tests = self._complete_answers(pair, answers)
+        with contextlib.ExitStack() as stack:
+            sandbox = None
+            # candidates take a sandbox each while they are validated
+            if self.sandbox_manager is not None and self.num_candidates == 1:
+                sandbox = stack.enter_context(self.sandbox_manager.sandbox())
+
+            repair = self._new_repair_conversation(pair)
+            for i in range(max_n):
+                gen_tests = [self._rename_test_class(checker, pair, gen_test) for gen_test in gen_tests]
+                passed, marked_tests = self._check_candidates(checker, pair, gen_tests, sandbox)
+                if passed is not None:
+                    gen_tests = [gen_tests[passed]]
+                    outcome = "passed"
+                    break
 
+                index = self._select_candidate(marked_tests)
+                buggy_query = repair.next_query(gen_tests[index], marked_tests[index], answers[index])
+                # the repair conversation carries the context, the chat memory only its window
+                repair.load_memory(self.memory)
+                answers = self._sample(self.llm_chain, buggy_query, self.num_candidates)
+                chat_history.append((buggy_query, "\n\n".join(answers)))
+                repair_rounds += 1
+
+                gen_tests = self._complete_answers(pair, answers)
+
+        span.set(outcome=outcome, repair_rounds=repair_rounds, candidates=self.num_candidates)
+        if self.response_cache is not None:
+            self.response_cache.evict()
+        result.test = gen_tests[0]
+        result.outcome = outcome
+        result.repair_rounds = repair_rounds
+        return result
+
+    async def _arun(self, chain: ConversationChain, query: str, semaphore: asyncio.Semaphore) -> str:
+        async for attempt in AsyncRetrying(
+                retry=retry_if_exception(is_rate_limit_error),
+                wait=wait_random_exponential(min=1, max=60),
+                stop=stop_after_attempt(self.max_retries),
+                reraise=True):
+            with attempt:
+                async with semaphore:
+                    return await chain.arun(query)
+
+    async def _acached_run(self, chain: ConversationChain, query: str, semaphore: asyncio.Semaphore) -> str:
+        with self.instrumentation.span("llm") as span:
+            prompt = self._get_prompt(chain, query)
+            if self.response_cache is None:
+                answer = await self._arun(chain, query, semaphore)
+                self._record_llm_call(span, prompt, answer, cached=False)
+                return answer
+
+            key = self._get_cache_key(prompt)
+            answer = self.response_cache.lookup(key)
+            cached = answer is not None
+            if answer is None:
+                answer = await self._arun(chain, query, semaphore)
+                self.response_cache.store(key, answer)
+            else:
+                chain.prep_outputs(chain.prep_inputs(query), {chain.output_key: answer})
+            self._record_llm_call(span, prompt, answer, cached=cached)
+            return answer
+
+    async def _agenerate_candidates(self, chain: ConversationChain, inputs: dict, num_candidates: int, semaphore: asyncio.Semaphore) -> List[str]:
+        async for attempt in AsyncRetrying(
+                retry=retry_if_exception(is_rate_limit_error),
+                wait=wait_random_exponential(min=1, max=60),
+                stop=stop_after_attempt(self.max_retries),
+                reraise=True):
+            with attempt:
+                async with semaphore:
+                    result = await self.model.agenerate_prompt([chain.prompt.format_prompt(**inputs)], n=num_candidates)
+                    return [generation.text for generation in result.generations[0]]
+
+    async def _asample(self, chain: ConversationChain, query: str, num_candidates: int, semaphore: asyncio.Semaphore) -> List[str]:
+        """Async `_sample`."""
+        if num_candidates == 1:
+            return [await self._acached_run(chain, query, semaphore)]
+        with self.instrumentation.span("llm", candidates=num_candidates) as span:
+            inputs = chain.prep_inputs(query)
+            prompt = chain.prompt.format(**inputs)
+            answers = self._lookup_candidates(prompt, num_candidates)
+            cached = answers is not None
+            if answers is None:
+                answers = await self._agenerate_candidates(chain, inputs, num_candidates, semaphore)
+                self._store_candidates(prompt, num_candidates, answers)
+            chain.prep_outputs(inputs, {chain.output_key: answers[0]})
+            self._record_llm_call(span, prompt, "".join(answers), cached=cached)
+            return answers
+
+    async def _acheck_candidates(self, checker: UnitTestChecker, pair: UnitTestPair, gen_tests: List[str],
+            checker_lock: asyncio.Lock) -> Tuple[Optional[int], List[Optional[str]]]:
+        if len(gen_tests) == 1:
+            marked_test = await self._acheck_test(checker, pair, gen_tests[0], checker_lock)
+            return (0, [None]) if marked_test is None else (None, [marked_test])
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        if self.sandbox_manager is not None:
+            return await loop.run_in_executor(None, context.run, self._check_candidates, checker, pair, gen_tests)
+        async with checker_lock:
+            return await loop.run_in_executor(None, context.run, self._check_candidates, checker, pair, gen_tests)
+
+    async def _acheck_test(self, checker: UnitTestChecker, pair: UnitTestPair, gen_test: str, checker_lock: asyncio.Lock) -> Optional[str]:
+        marked_test = self._check_syntax(gen_test)
+        if marked_test is not None:
+            return marked_test
+        loop = asyncio.get_running_loop()
+        # keep the current span as the parent of the spans of the worker thread
+        context = contextvars.copy_context()
+        if self.sandbox_manager is not None:
+            return await loop.run_in_executor(None, context.run, self._check_test_in_sandbox, checker, pair, gen_test)
+        # generated tests are written into the shared project tree, validate one at a time
+        async with checker_lock:
+            return await loop.run_in_executor(None, context.run, self._check_test, checker, pair, gen_test, None, True)
+
+    async def abasic_generate(self, pair: UnitTestPair, semaphore: asyncio.Semaphore):
+        with self._generate_span(pair, "basic") as span:
+            chain = self._new_chain()
+            answer = await self._acached_run(chain, self._get_basic_query(pair), semaphore)
+            span.set(outcome="unchecked")
+            return self._complete_basic_answer(pair, answer)
+
+    async def aiterative_generate(self, pair: UnitTestPair, semaphore: asyncio.Semaphore, checker_lock: asyncio.Lock, max_n: int=2):
+        result = await self.aiterative_generate_result(pair, semaphore, checker_lock, max_n)
+        return result.test
+
+    async def aiterative_generate_result(self, pair: UnitTestPair, semaphore: asyncio.Semaphore, checker_lock: asyncio.Lock, max_n: int = 2,
+            on_state: Optional[StateCallback] = None) -> GenerationResult:
+        """
+        `aiterative_generate` with the outcome, repair rounds and transcript of the pair.
+        params:
+            on_state: called on every state change of the pair
+        """
+        with self._generate_span(pair, "iterative") as span:
+            return await self._aiterative_generate(pair, semaphore, checker_lock, max_n, span, on_state)
+
+    async def _aiterative_generate(self, pair: UnitTestPair, semaphore: asyncio.Semaphore, checker_lock: asyncio.Lock, max_n: int, span: Span,
+            on_state: Optional[StateCallback] = None) -> GenerationResult:
+        result = GenerationResult()
+        set_state = on_state if on_state is not None else lambda state, result: None
+        checker = self.checker
+        outcome = "failed"
+        repair_rounds = 0
+        # conversation state of this pair only
+        chain = self._new_chain()
+
+        set_state("generating", result)
+        intention_query = self._get_intention_query(pair)
+        intention_answer = await self._acached_run(chain, intention_query, semaphore)
+        result.transcript.append((intention_query, intention_answer))
+        generation_query = self._get_generation_query(pair, intention_answer)
+        generation_answers = await self._asample(chain, generation_query, self.num_candidates, semaphore)
+        result.transcript.append((generation_query, "\n\n".join(generation_answers)))
+
+        answers = generation_answers
+        gen_tests = self._complete_answers(pair, answers)
+        repair = self._new_repair_conversation(pair)
+        for i in range(max_n):
+            gen_tests = [self._rename_test_class(checker, pair, gen_test) for gen_test in gen_tests]
+            result.test = gen_tests[0]
+            set_state("validating", result)
+            passed, marked_tests = await self._acheck_candidates(checker, pair, gen_tests, checker_lock)
+            if passed is not None:
+                gen_tests = [gen_tests[passed]]
+                outcome = "passed"
+                break
+
+            set_state("generating", result)
+            index = self._select_candidate(marked_tests)
+            buggy_query = repair.next_query(gen_tests[index], marked_tests[index], answers[index])
+            repair.load_memory(chain.memory)
+            answers = await self._asample(chain, buggy_query, self.num_candidates, semaphore)
+            result.transcript.append((buggy_query, "\n\n".join(answers)))
+            repair_rounds += 1
+            result.repair_rounds = repair_rounds
+            gen_tests = self._complete_answers(pair, answers)
+        span.set(outcome=outcome, repair_rounds=repair_rounds, candidates=self.num_candidates)
+        result.test = gen_tests[0]
+        result.outcome = outcome
+        return result
+
+    async def abatch_generate(self, pairs: List[UnitTestPair], max_concurrency: int = 4, iterative: bool = True, max_n: int = 2) -> List[str]:
+        """
+        params:
+            pairs: unit test pairs to generate tests for
+            max_concurrency: maximum number of model requests in flight
+            iterative: use `iterative_generate`, otherwise `basic_generate`
+            max_n: maximum number of repair rounds for iterative generation
+        returns: generated tests, in the order of `pairs`
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        checker_lock = asyncio.Lock()
+        if iterative:
+            tasks = [self.aiterative_generate(pair, semaphore, checker_lock, max_n) for pair in pairs]
+        else:
+            tasks = [self.abasic_generate(pair, semaphore) for pair in pairs]
+        results = await asyncio.gather(*tasks)
+        if self.response_cache is not None:
+            self.response_cache.evict()
+        return results
+
+    def batch_generate(self, pairs: List[UnitTestPair], max_concurrency: int = 4, iterative: bool = True, max_n: int = 2) -> List[str]:
+        return asyncio.run(self.abatch_generate(pairs, max_concurrency, iterative, max_n))
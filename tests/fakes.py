@@ -0,0 +1,93 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+"""Local stand-ins for the chat model and the checker, no network and no build."""
+
+import asyncio
+import threading
+from typing import Callable, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+
+from chattester.checker import UnitTestChecker
+from chattester.maven_parser import MavenOutput, MavenOutputLine
+
+TEST_ANSWER = """```java
+    @Test
+    public void testMethod0() {
+        assertEquals(0, new Focal0().method0(0, ""));
+    }
+```"""
+
+
+class RateLimitError(Exception):
+    """Named like the openai error that the generator retries."""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers with `respond(messages)`, `TEST_ANSWER` by default, after
+    `delay(messages)` seconds in async calls, and records the messages of
+    every call. The first `rate_limits` calls raise a 429.
+    """
+    model_name: str = "fake"
+    temperature: float = 0.0
+    respond: Optional[Callable[[List[BaseMessage]], str]] = None
+    rate_limits: int = 0
+    delay: Optional[Callable[[List[BaseMessage]], float]] = None
+    calls: List[List[BaseMessage]] = []
+    rejected: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _answer(self, messages: List[BaseMessage]) -> ChatResult:
+        if self.rejected < self.rate_limits:
+            self.rejected += 1
+            raise RateLimitError("429 Too Many Requests")
+        self.calls.append(list(messages))
+        content = self.respond(messages) if self.respond is not None else TEST_ANSWER
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.delay is not None:
+            await asyncio.sleep(self.delay(messages))
+        return self._answer(messages)
+
+
+class StubChecker(UnitTestChecker):
+    """
+    Fails the first `num_failures` checks with a compiler error at `error_lines[i]`, without building.
+    """
+    def __init__(self, project_path: str, num_failures: int = 1, error_lines: Optional[List[int]] = None) -> None:
+        super().__init__(project_path)
+        self.num_failures = num_failures
+        self.error_lines = error_lines if error_lines is not None else [8]
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def create_test(self, path: str, content: str):
+        pass
+
+    def check(self, test_path: str, cancel_event=None) -> MavenOutput:
+        with self._calls_lock:
+            index = self.calls
+            self.calls += 1
+        out = MavenOutput([])
+        if index < self.num_failures:
+            line = self.error_lines[index % len(self.error_lines)]
+            out.status = "failure"
+            out.append(MavenOutputLine("error", f"/project/FocalTestGeneration.java:[{line},9] cannot find symbol"))
+        else:
+            out.status = "success"
+        return out
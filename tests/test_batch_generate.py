@@ -0,0 +1,86 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import asyncio
+import re
+
+import pytest
+
+from benchmark.corpus import make_project
+from chattester.focal import ProjectUnitTestExtractor
+from chattester.tester import ChatGPTUnitTestGenerator
+from tests.fakes import FakeChatModel, StubChecker
+
+FOCAL_CLASS_PATTERN = re.compile(r"class (Focal[0-9]+)")
+
+
+def get_focal_classes(messages) -> set:
+    return set(FOCAL_CLASS_PATTERN.findall("\n".join(m.content for m in messages)))
+
+
+def answer_for_focal_class(messages) -> str:
+    focal_class = sorted(get_focal_classes(messages))[0]
+    return f"```java\n    @Test\n    public void test{focal_class}() {{\n        new {focal_class}();\n    }}\n```"
+
+
+@pytest.fixture
+def pairs(tmp_path):
+    make_project(str(tmp_path), num_classes=4, num_methods=1)
+    pairs = ProjectUnitTestExtractor(str(tmp_path)).get_all_tests()
+    assert len(pairs) == 4
+    return pairs
+
+
+def test_results_follow_input_order(tmp_path, pairs):
+    # the first pairs answer last
+    delays = {pair.focal_class.name: 0.05 * (len(pairs) - i) for i, pair in enumerate(pairs)}
+    model = FakeChatModel(
+        respond=answer_for_focal_class,
+        delay=lambda messages: delays[sorted(get_focal_classes(messages))[0]],
+    )
+    generator = ChatGPTUnitTestGenerator(str(tmp_path), model=model)
+
+    results = generator.batch_generate(pairs, max_concurrency=len(pairs), iterative=False)
+
+    assert [f"test{pair.focal_class.name}()" in result for pair, result in zip(pairs, results)] == [True] * len(pairs)
+
+
+def test_pairs_keep_their_own_memory(tmp_path, pairs, monkeypatch):
+    model = FakeChatModel(respond=answer_for_focal_class, delay=lambda messages: 0.01)
+    generator = ChatGPTUnitTestGenerator(str(tmp_path), model=model)
+    generator.checker = StubChecker(str(tmp_path), num_failures=len(pairs))
+    monkeypatch.chdir(tmp_path)
+
+    results = generator.batch_generate(pairs, max_concurrency=len(pairs), iterative=True, max_n=2)
+
+    assert len(results) == len(pairs)
+    # intention, generation and at least one repair per pair, each prompt only knows its own pair
+    assert len(model.calls) >= 3 * len(pairs)
+    for messages in model.calls:
+        assert len(get_focal_classes(messages)) == 1
+    generation_prompts = [m[-1].content for m in model.calls if "Method intention" in m[-1].content]
+    assert len(generation_prompts) == len(pairs)
+    for prompt in generation_prompts:
+        # the intention exchange of the same pair is in the conversation memory
+        assert prompt.count("Please infer the intention") == 1
+
+
+def test_rate_limits_are_retried_with_backoff(tmp_path, pairs, monkeypatch):
+    sleeps = []
+    sleep = asyncio.sleep
+
+    async def record_sleep(seconds, *args, **kwargs):
+        sleeps.append(seconds)
+        await sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", record_sleep)
+    model = FakeChatModel(rate_limits=2)
+    generator = ChatGPTUnitTestGenerator(str(tmp_path), model=model, max_retries=6)
+
+    results = generator.batch_generate(pairs[:1], iterative=False)
+
+    assert len(results) == 1 and "testMethod0" in results[0]
+    assert model.rejected == 2 and len(model.calls) == 1
+    assert len(sleeps) == 2 and all(0 < seconds <= 60 for seconds in sleeps)
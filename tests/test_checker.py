@@ -0,0 +1,113 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import threading
+
+import pytest
+
+from chattester.checker import UnitTestChecker
+from chattester.cmd_utils import CommandResult
+from chattester import compile_service
+
+JUNIT_FAILURE_OUTPUT = """JUnit version 4.13.2
+..E
+Time: 0.012
+There was 1 failure:
+1) testAdd(com.example.FocalTestGeneration)
+java.lang.AssertionError: expected:<1> but was:<2>
+	at org.junit.Assert.fail(Assert.java:89)
+	at com.example.FocalTestGeneration.testAdd(FocalTestGeneration.java:12)
+
+FAILURES!!!
+Tests run: 2,  Failures: 1
+
+"""
+
+
+@pytest.fixture
+def test_path(tmp_path):
+    test_dir = tmp_path / "src" / "test" / "java" / "com" / "example"
+    test_dir.mkdir(parents=True)
+    path = test_dir / "FocalTestGeneration.java"
+    path.write_text("package com.example;\n", encoding="utf-8")
+    return str(path)
+
+
+def make_checker(project_path: str, java_output: str, java_success: bool) -> UnitTestChecker:
+    checker = UnitTestChecker(project_path, mode="focused")
+    checker.resolve_classpath = lambda module_path: ("classes", "")
+
+    def run(args, cwd, cancel_event=None, on_line=None):
+        if args[0] == "javac":
+            return CommandResult(args=args, output="", returncode=0, success=True)
+        return CommandResult(args=args, output=java_output, returncode=0 if java_success else 1, success=java_success)
+    checker._run = run
+    return checker
+
+
+def test_focused_test_failure_has_report(tmp_path, test_path):
+    checker = make_checker(str(tmp_path), JUNIT_FAILURE_OUTPUT, java_success=False)
+
+    out = checker.run_focused_test(test_path)
+
+    assert out.status == "failure"
+    assert out.test_report is not None and out.test_report.failures == 1
+    case = out.test_report.test_cases[0]
+    assert (case.name, case.class_name, case.status, case.line) == ("testAdd", "com.example.FocalTestGeneration", "failure", 12)
+    assert case.type == "java.lang.AssertionError"
+    assert out.text == JUNIT_FAILURE_OUTPUT
+
+
+def test_focused_test_crash_is_a_failure(tmp_path, test_path):
+    checker = make_checker(str(tmp_path), "Exception in thread \"main\" java.lang.NoClassDefFoundError: org/junit/runner/JUnitCore\n", java_success=False)
+
+    out = checker.run_focused_test(test_path)
+
+    assert out.status == "failure"
+    assert out.test_report is not None and out.test_report.test_cases == []
+    assert "NoClassDefFoundError" in out.output[-1].msg
+
+
+def test_focused_test_success(tmp_path, test_path):
+    checker = make_checker(str(tmp_path), "JUnit version 4.13.2\n..\nTime: 0.01\n\nOK (2 tests)\n", java_success=True)
+
+    out = checker.run_focused_test(test_path)
+
+    assert out.status == "success"
+    assert out.test_report is not None and out.test_report.success
+
+
+class CancellingService(object):
+    """Compile service whose compile request cancels the check."""
+    def __init__(self, cancel_event: threading.Event) -> None:
+        self.cancel_event = cancel_event
+        self.requests = []
+        self.restarts = 0
+
+    def compile(self, path, source_text, output_dir):
+        self.requests.append("compile")
+        self.cancel_event.set()
+        return compile_service.CompileResult(success=True)
+
+    def run_tests(self, class_name):
+        self.requests.append("run")
+        return compile_service.TestRunResult(success=True)
+
+
+@pytest.mark.parametrize("cancel_before", ["compile", "run"])
+def test_service_test_checks_cancel_event(tmp_path, test_path, cancel_before):
+    cancel_event = threading.Event()
+    if cancel_before == "compile":
+        cancel_event.set()
+    service = CancellingService(cancel_event)
+    checker = UnitTestChecker(str(tmp_path), mode="service")
+    checker.resolve_classpath = lambda module_path: ("classes", "")
+    checker.get_compile_service = lambda module_path, classpath: service
+
+    out = checker.check(test_path, cancel_event)
+
+    assert out.status == "failure"
+    assert out.output[-1].msg == f"`{cancel_before} com.example.FocalTestGeneration` cancelled"
+    assert service.requests == ([] if cancel_before == "compile" else ["compile"])
@@ -0,0 +1,144 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+import os
+
+import pytest
+
+from benchmark.corpus import make_project
+from chattester.focal import ProjectUnitTestExtractor
+from chattester.javalang_utils import NodeSpanIndex, get_method_start_end
+from chattester.source import ClassInfo, ParsedJavaFile
+
+TRICKY_SOURCE = """package com.example;
+
+import java.util.Comparator;
+
+public class Tricky {
+    private String open = "{";
+    private final Comparator<String> order = new Comparator<String>() {
+        @Override
+        public int compare(String a, String b) {
+            return a.compareTo(b);
+        }
+    };
+
+    /**
+     * Closes a brace in a string.
+     */
+    @Deprecated
+    public String close(String text) {
+        // a } in a comment
+        char c = '}';
+        return text + "}" + c;
+    }
+
+    @SuppressWarnings({"unchecked", "rawtypes"})
+    static int plain(int x) {
+        if (x > 0) {
+            return x;
+        }
+        return -x;
+    }
+}
+"""
+
+# pairs extracted from make_project(num_classes=2, num_methods=2, num_packages=1) before the
+# member texts were sliced from tokens: test file, focal class, method, declaration, package
+BASELINE_PAIRS = [
+    ("src/test/java/com/bench/pkg0/Focal0Test.java", "Focal0", "method0", "method0(int a, String b)", "package com.bench.pkg0;"),
+    ("src/test/java/com/bench/pkg0/Focal0Test.java", "Focal0", "method1", "method1(int a, String b)", "package com.bench.pkg0;"),
+    ("src/test/java/com/bench/pkg0/Focal1Test.java", "Focal1", "method0", "method0(int a, String b)", "package com.bench.pkg0;"),
+    ("src/test/java/com/bench/pkg0/Focal1Test.java", "Focal1", "method1", "method1(int a, String b)", "package com.bench.pkg0;"),
+]
+BASELINE_METHOD_TEXT = """    public int {name}(int a, String b) {{
+        int total = a + {field};
+        for (int j = 0; j < b.length(); j++) {{
+            if (b.charAt(j) == 'x') {{
+                total += j;
+            }} else {{
+                names.add(b.substring(j));
+            }}
+        }}
+        return total;
+    }}"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    make_project(str(tmp_path), num_classes=2, num_methods=2, num_packages=1)
+    return str(tmp_path)
+
+
+def get_parsed_files(project: str):
+    focal_path = os.path.join(project, "src/main/java/com/bench/pkg0/Focal1.java")
+    test_path = os.path.join(project, "src/test/java/com/bench/pkg0/Focal1Test.java")
+    return [
+        ParsedJavaFile("Tricky.java", TRICKY_SOURCE),
+        ParsedJavaFile.from_path(focal_path),
+        ParsedJavaFile.from_path(test_path),
+    ]
+
+
+def test_node_spans_match_get_method_start_end(project):
+    for parsed in get_parsed_files(project):
+        spans = NodeSpanIndex(parsed.tree)
+        for path, node in parsed.tree:
+            assert spans.get(node) == get_method_start_end(parsed.tree, node)
+
+
+def test_parallel_extraction_matches_serial(tmp_path):
+    make_project(str(tmp_path), num_classes=6, num_methods=2, num_packages=2)
+    extractor = ProjectUnitTestExtractor(str(tmp_path))
+
+    serial = extractor.get_all_tests()
+    parallel = extractor.get_all_tests(num_workers=2, chunksize=2)
+
+    assert len(serial) == 12
+    assert parallel == serial
+    assert list(extractor.iter_tests(num_workers=3)) == serial
+
+
+def test_member_texts_are_sliced_from_tokens():
+    parsed = ParsedJavaFile("Tricky.java", TRICKY_SOURCE)
+    class_info = ClassInfo.from_node(parsed, parsed.tree.types[0])
+
+    assert class_info.text == TRICKY_SOURCE[TRICKY_SOURCE.index("public class"):].rstrip()
+    assert [(f.name, f.range.start_line, f.range.end_line) for f in class_info.fields] == [("open", 6, 6), ("order", 7, 12)]
+    assert class_info.fields[0].text == 'private String open = "{";'
+    assert class_info.fields[1].text.endswith("return a.compareTo(b);\n        }\n    };")
+
+    methods = {m.name: m for m in class_info.methods}
+    assert methods["close"].text == """    /**
+     * Closes a brace in a string.
+     */
+    @Deprecated
+    public String close(String text) {
+        // a } in a comment
+        char c = '}';
+        return text + "}" + c;
+    }"""
+    assert (methods["close"].range.start_line, methods["close"].range.end_line) == (14, 22)
+    assert methods["plain"].text.startswith('    @SuppressWarnings({"unchecked", "rawtypes"})\n    static int plain(int x) {')
+    assert methods["plain"].text.endswith("        return -x;\n    }")
+    assert methods["compare"].text.startswith("        @Override\n")
+
+
+def test_pairs_match_baseline(project):
+    pairs = ProjectUnitTestExtractor(project).get_all_tests()
+
+    assert [
+        (os.path.relpath(p.test_path, project).replace(os.sep, "/"), p.focal_class.name,
+         p.focal_method.name, p.focal_method.declaration, p.package_info)
+        for p in pairs
+    ] == BASELINE_PAIRS
+    for pair in pairs:
+        method = pair.focal_method
+        baseline_text = BASELINE_METHOD_TEXT.format(name=method.name, field="field" + method.name[len("method"):])
+        # the declaration now starts at its javadoc
+        assert method.text.startswith("    /**\n")
+        assert method.text.endswith("*/\n" + baseline_text)
+        assert [f.name for f in pair.focal_class.fields] == ["field0", "field1", "field2", "field3", "field4", "names"]
+        assert pair.focal_class.fields[-1].text == "private final List<String> names = new ArrayList<>();"
@@ -0,0 +1,68 @@
+# Copyright 2023 by XiaHan. All rights reserved.
+# This file is part of the ChatTester,
+# and is released under the "MIT License Agreement". Please see the LICENSE
+# file that should have been included as part of this package.
+
+from langchain.memory import ConversationBufferMemory
+
+from benchmark.corpus import make_project
+from chattester.context import FocalContextBuilder
+from chattester.focal import ProjectUnitTestExtractor
+from chattester.tester import ChatGPTUnitTestGenerator
+from chattester.repair import RepairConversation
+from tests.fakes import FakeChatModel, StubChecker
+
+# a test class long enough for a one line change to be cheaper as a diff
+LONG_ANSWER = "```java\n" + "\n".join(
+    f"    @Test\n    public void testMethod{i}() {{\n        assertEquals({i}, new Focal0().method0({i}, \"\"));\n    }}"
+    for i in range(20)
+) + "\n```"
+
+
+def get_pair(tmp_path):
+    make_project(str(tmp_path), num_classes=1, num_methods=3)
+    return ProjectUnitTestExtractor(str(tmp_path)).get_all_tests()[0]
+
+
+def test_next_query_sends_diff_against_previous_round(tmp_path):
+    pair = get_pair(tmp_path)
+    generator = ChatGPTUnitTestGenerator(str(tmp_path), model=FakeChatModel())
+    test = generator._complete_answer(pair, LONG_ANSWER)
+    first = generator._mark_buggy_line(test, [(10, "// <Buggy Line>: cannot find symbol")])
+    second = generator._mark_buggy_line(test, [(30, "// <Buggy Line>: cannot find symbol")])
+    repair = RepairConversation(pair, generator.bug_prompt_with_context, FocalContextBuilder())
+    memory = ConversationBufferMemory()
+
+    first_query = repair.next_query(test, first, LONG_ANSWER)
+    repair.load_memory(memory)
+    assert "```diff" not in first_query and first in first_query
+    assert repair.window is None and len(memory.chat_memory.messages) == 0
+
+    second_query = repair.next_query(test, second, LONG_ANSWER)
+    repair.load_memory(memory)
+    assert "```diff" in second_query and second not in second_query
+    assert repair.window == (first_query, LONG_ANSWER)
+    assert [m.content for m in memory.chat_memory.messages] == [first_query, LONG_ANSWER]
+
+    # the base of a diff must have been sent in full by the last query
+    third_query = repair.next_query(test, first, LONG_ANSWER)
+    assert "```diff" not in third_query and repair.window is None
+
+
+def test_iterative_generate_repairs_with_diff_window(tmp_path, monkeypatch):
+    pair = get_pair(tmp_path)
+    model = FakeChatModel(respond=lambda messages: LONG_ANSWER)
+    generator = ChatGPTUnitTestGenerator(str(tmp_path), model=model)
+    generator.checker = StubChecker(str(tmp_path), num_failures=2, error_lines=[10, 30])
+    monkeypatch.chdir(tmp_path)
+
+    generator.iterative_generate(pair, max_n=3)
+
+    # intention, generation and two repairs, the second one only sends the diff
+    assert len(model.calls) == 4
+    first_prompt, second_prompt = model.calls[2][-1].content, model.calls[3][-1].content
+    assert "```diff" not in first_prompt
+    first_query = first_prompt[first_prompt.index("// Test Method"):first_prompt.rindex("\nAI:")]
+    # the window: the first repair query and its answer, then the diff
+    assert first_query in second_prompt and LONG_ANSWER in second_prompt
+    assert "```diff" in second_prompt[second_prompt.index(LONG_ANSWER):]